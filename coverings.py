@@ -1,6 +1,8 @@
-from mathematics import lcm
+from mathematics import lcm, gcd
 from operator import itemgetter
 from collections import deque
+from mathematics.parallel import pool_map, pool_imap, chunk_count
+import random
 
 def residue_sets(moduli):
 	'''Iterator for all possible residue choices given a list of moduli'''
@@ -61,30 +63,343 @@ class Congruence:
 	def __repr__(self):
 		return self.__str__()
 
+#Translation tables that add or subtract one from every byte of
+#a bytearray, stopping at 255 and 0
+INCREMENT = bytearray( range( 1, 256 ) + [255] )
+DECREMENT = bytearray( [0] + range( 255 ) )
+
+def class_slice( congruence, length, start = 0 ):
+	'''
+	Returns the slice of a bitmap of the integers start to
+	start + length that holds the integers satisfying the congruence
+	'''
+	return slice( (congruence.residue - start) % congruence.modulus, length, congruence.modulus )
+
+def sieve( congruences, length, start = 0 ):
+	'''
+	Returns a bytearray marking with 1 each integer from start to
+	start + length that satisfies one of the congruences. Each
+	residue class is marked with one strided slice assignment.
+	'''
+	bitmap = bytearray( length )
+	if not congruences:
+		return bitmap
+
+	ones = memoryview( bytearray( '\x01' ) * ( length // min( c.modulus for c in congruences ) + 1 ) )
+
+	for congruence in congruences:
+		marks = class_slice( congruence, length, start )
+		bitmap[marks] = ones[:len( xrange( *marks.indices( length ) ) )]
+
+	return bitmap
+
+def coverage_counts( congruences, length, start = 0 ):
+	'''
+	Returns a bytearray with the number of congruences that each
+	integer from start to start + length satisfies. Counts stop at 255.
+	'''
+	counts = bytearray( length )
+
+	for congruence in congruences:
+		marks = class_slice( congruence, length, start )
+		counts[marks] = counts[marks].translate( INCREMENT )
+
+	return counts
+
+def zeros( bitmap, offset = 0 ):
+	'''Iterates through offset plus the index of each 0 in the bitmap'''
+	i = bitmap.find( '\x00' )
+	while i >= 0:
+		yield offset + i
+		i = bitmap.find( '\x00', i + 1 )
+
+#Number of integers sieved at a time by the streaming methods,
+#small enough for the bitmap to stay in cache
+WINDOW = 1 << 18
+
+def period( congruences ):
+	'''Returns the lcm of the moduli of the congruences, or 1 if there are none'''
+	if not congruences:
+		return 1
+	return lcm( [c.modulus for c in congruences] )
+
+def uncovered_windows( congruences, start = 0, stop = None, window = WINDOW ):
+	'''
+	Yields the start and the sieve bitmap of each window of the
+	integers from start to stop, which defaults to the lcm
+	'''
+	if stop is None:
+		stop = period( congruences )
+
+	low = start
+	while low < stop:
+		high = min( low + window, stop )
+		yield low, sieve( congruences, high - low, low )
+		low = high
+
+def iter_uncovered( congruences, start = 0, stop = None, limit = None, window = WINDOW ):
+	'''
+	Yields the integers from start to stop, which defaults to the
+	lcm, that none of the congruences contain, sieving one window at a
+	time. Stops after 'limit' integers if it is given.
+	'''
+	if limit is not None and limit <= 0:
+		return
+
+	found = 0
+	for low, bitmap in uncovered_windows( congruences, start, stop, window ):
+		for x in zeros( bitmap, low ):
+			yield x
+
+			found += 1
+			if found == limit:
+				return
+
+def uncovered_counts( congruences, start = 0, stop = None, window = WINDOW ):
+	'''Yields the start of each window and the number of uncovered integers in it'''
+	for low, bitmap in uncovered_windows( congruences, start, stop, window ):
+		yield low, bitmap.count( '\x00' )
+
+def split_range( start, stop, parts ):
+	'''Splits the integers from start to stop into at most 'parts' consecutive ranges'''
+	size = max( 1, -( -( stop - start ) // parts ) )
+	ranges = []
+	while start < stop:
+		ranges.append( ( start, min( start + size, stop ) ) )
+		start += size
+	return ranges
+
+def uncovered_task( task ):
+	'''
+	Counts, or lists up to the limit, the uncovered integers of one
+	range. Runs in a worker process.
+	'''
+	classes, low, high, counting, limit, window = task
+	congruences = [Congruence( c, m ) for c, m in classes]
+
+	if counting:
+		return sum( count for _, count in uncovered_counts( congruences, low, high, window ) )
+	return list( iter_uncovered( congruences, low, high, limit, window ) )
+
+def parallel_tasks( congruences, start, stop, counting, limit, workers, window ):
+	'''Returns one task per range, with CHUNKS_PER_WORKER ranges per worker'''
+	if stop is None:
+		stop = period( congruences )
+
+	classes = [( c.residue, c.modulus ) for c in congruences]
+	return [( classes, low, high, counting, limit, window ) for low, high in split_range( start, stop, chunk_count( workers ) )]
+
+def parallel_uncovered_count( congruences, start = 0, stop = None, workers = None, window = WINDOW ):
+	'''Counts the uncovered integers from start to stop with a pool of worker processes'''
+	tasks = parallel_tasks( congruences, start, stop, True, None, workers, window )
+	return sum( pool_map( uncovered_task, tasks, workers ) )
+
+def parallel_uncovered( congruences, start = 0, stop = None, limit = None, workers = None, window = WINDOW ):
+	'''
+	Lists the uncovered integers from start to stop in order, or the
+	first 'limit' of them, with a pool of worker processes. The ranges
+	after the limit is reached are abandoned.
+	'''
+	tasks = parallel_tasks( congruences, start, stop, False, limit, workers, window )
+
+	found = []
+	results = pool_imap( uncovered_task, tasks, workers )
+	try:
+		for witnesses in results:
+			found.extend( witnesses )
+			if limit is not None and len( found ) >= limit:
+				break
+	finally:
+		results.close()
+
+	return found[:limit]
+
+#Largest lcm that is_covering checks with a single sieve
+SIEVE_LIMIT = 1 << 24
+
+def prime_factors( n ):
+	'''Returns the primes dividing n, each repeated by its exponent'''
+	factors = []
+	p = 2
+	while p * p <= n:
+		while n % p == 0:
+			factors.append( p )
+			n //= p
+		p += 1
+	if n > 1:
+		factors.append( n )
+	return factors
+
+def inverse( a, modulus ):
+	'''Returns the inverse of a modulo the modulus, which must be coprime to a'''
+	x, last_x = 0, 1
+	b = modulus
+	while b:
+		quotient = a // b
+		a, b = b, a - quotient * b
+		x, last_x = last_x - quotient * x, x
+	return last_x % modulus
+
+def factor_order( moduli ):
+	'''
+	Orders the prime factors of the lcm of the moduli so that as many
+	moduli as possible divide each product of the first factors
+	'''
+	remaining = {}
+	for modulus in moduli:
+		factors = prime_factors( modulus )
+		for p in set( factors ):
+			remaining[p] = max( remaining.get( p, 0 ), factors.count( p ) )
+
+	order = []
+	partial = 1
+	pending = [m for m in moduli if m > 1]
+
+	while remaining:
+		#Take the prime that completes the most moduli, smallest first
+		best = max( sorted( remaining ), key = lambda p: ( sum( 1 for m in pending if partial * p % m == 0 ), -p ) )
+
+		order.append( best )
+		partial *= best
+		pending = [m for m in pending if partial % m]
+
+		remaining[best] -= 1
+		if remaining[best] == 0:
+			del remaining[best]
+
+	return order
+
+def prime_power_witness( congruences, sieve_limit = SIEVE_LIMIT ):
+	'''
+	Decides whether the congruences cover the integers without
+	enumerating up to their lcm. Returns an integer that none of them
+	contain, or None if they are a covering.
+
+	The residue of x is fixed modulo one prime factor of the lcm at a
+	time. A branch is pruned as soon as a congruence whose modulus
+	divides the partial modulus contains it, and the congruences that
+	cannot meet the branch are dropped. Once the part of the lcm left
+	is at most sieve_limit, the lifts of the branch are sieved
+	instead. Only one branch is held per level.
+	'''
+	classes = sorted( set( ( c.residue % c.modulus, c.modulus ) for c in congruences ) )
+	if not classes:
+		return 0
+
+	moduli = sorted( set( m for c, m in classes ) )
+	factors = factor_order( moduli )
+
+	#gcd of each modulus with the partial modulus at each depth
+	gcds = []
+	partial = 1
+	for p in factors:
+		partial *= p
+		gcds.append( dict( ( m, gcd( m, partial ) ) for m in moduli ) )
+
+	return branch_witness( 0, 1, classes, factors, gcds, 0, partial, sieve_limit )
+
+def branch_witness( residue, modulus, classes, factors, gcds, depth, lcm_of_moduli, sieve_limit ):
+	'''
+	Returns an integer congruent to residue (mod modulus) that none
+	of the classes contain, or None. The classes are the (residue,
+	modulus) pairs that can meet the branch.
+	'''
+	if not classes:
+		return residue
+
+	if lcm_of_moduli // modulus <= sieve_limit:
+		return sieve_witness( residue, modulus, classes, lcm_of_moduli // modulus )
+
+	step = modulus
+	modulus *= factors[depth]
+	divisors = gcds[depth]
+
+	for lift in xrange( residue, modulus, step ):
+		remaining = []
+
+		for c, m in classes:
+			g = divisors[m]
+			if ( lift - c ) % g:
+				continue
+			if g == m:
+				break
+			remaining.append( ( c, m ) )
+		else:
+			witness = branch_witness( lift, modulus, remaining, factors, gcds, depth + 1, lcm_of_moduli, sieve_limit )
+			if witness is not None:
+				return witness
+
+	return None
+
+def sieve_witness( residue, modulus, classes, length ):
+	'''
+	Sieves the integers residue + j*modulus for j up to length and
+	returns the first one none of the classes contain, or None
+	'''
+	bitmap = bytearray( length )
+
+	for c, m in classes:
+		g = gcd( m, modulus )
+		period = m // g
+		start = ( c - residue ) // g * inverse( modulus // g % period, period ) % period
+		bitmap[start::period] = '\x01' * len( xrange( start, length, period ) )
+
+	j = bitmap.find( '\x00' )
+	if j < 0:
+		return None
+	return residue + j * modulus
+
 class Covering:
 	'''
 	Treats a set of congruences as a covering system of the integers
 	that can be added to and tested for covering.
+
+	If 'track' is set, the number of congruences covering each integer
+	up to the lcm is kept in 'counts' along with the number of
+	uncovered integers, so is_covering takes constant time. Each add,
+	remove or update then costs O(lcm/modulus), and at most 255
+	congruences may be added. Congruences must then only be changed
+	through the covering.
 	'''
-	def __init__(self):
+	def __init__(self, track = False):
 		'''Establishes a covering with no congruences and lcm=1'''
 		self.congruences = []
 		self.lcm = 1
+
+		self.counts = None
+		self.uncovered_count = 1
+		if track:
+			self.counts = bytearray( 1 )
 	
 	def add( self, residue, modulus=2 ):
 		'''
 		Adds the residue/modulus congruence to the congruences and 
 		increases the lcm accordingly.
 		'''
+		if self.counts is not None and len( self.congruences ) == 255:
+			raise ValueError( 'A tracked covering holds at most 255 congruences' )
+
 		if residue.__class__ == Congruence:
-			self.congruences.append( residue )
+			congruence = residue
 			modulus = residue.modulus
 			residue = residue.residue
 		else:
-			self.congruences.append( Congruence( residue, modulus ) )
+			congruence = Congruence( residue, modulus )
+
+		self.congruences.append( congruence )
 		
 		if not self.lcm % modulus == 0:
-			self.lcm = lcm( self.lcm, modulus )
+			new_lcm = lcm( self.lcm, modulus )
+
+			#The counts repeat with period lcm, so tile them
+			if self.counts is not None:
+				self.counts *= new_lcm // self.lcm
+				self.uncovered_count *= new_lcm // self.lcm
+
+			self.lcm = new_lcm
+
+		if self.counts is not None:
+			self.mark_class( congruence, INCREMENT )
 	
 	def fill( self, congruences ):
 		'''Adds all the congruences given in the zipped list of residue, modulus tuples'''
@@ -103,15 +418,47 @@ class Covering:
 		else:
 			self.congruences.remove( Congruence( residue, modulus ) )
 
-		self.lcm = lcm( filter( lambda x: x.modulus, self.congruences ) )
+		if self.counts is not None:
+			self.mark_class( Congruence( residue, modulus ), DECREMENT )
+
+		if self.congruences:
+			new_lcm = lcm( map( lambda x: x.modulus, self.congruences ) )
+		else:
+			new_lcm = 1
+
+		#The counts repeat with the smaller period too
+		if self.counts is not None and new_lcm != self.lcm:
+			del self.counts[new_lcm:]
+			self.uncovered_count = self.counts.count( '\x00' )
+
+		self.lcm = new_lcm
 
 	def update( self, residue, modulus ):
 		'''Replaces the residue for a given modulus'''
 		for congruence in self.congruences:
 			if congruence.modulus == modulus:
+				if self.counts is not None:
+					self.mark_class( congruence, DECREMENT )
+
 				congruence.residue = residue % modulus
+
+				if self.counts is not None:
+					self.mark_class( congruence, INCREMENT )
 				break
 
+	def mark_class( self, congruence, table ):
+		'''
+		Translates the counts of the integers satisfying the congruence
+		by the INCREMENT or DECREMENT table and updates the number of
+		uncovered integers
+		'''
+		marks = class_slice( congruence, self.lcm )
+		before = self.counts[marks]
+		after = before.translate( table )
+
+		self.uncovered_count += after.count( '\x00' ) - before.count( '\x00' )
+		self.counts[marks] = after
+
 	def __iter__(self):
 		'''Iterates through the congruences in order of increasing modulus'''
 		
@@ -124,29 +471,44 @@ class Covering:
 	def __repr__(self):
 		return self.__str__()
 
+	def sieve(self):
+		'''Returns a bytearray marking with 1 each integer up to the lcm that is covered'''
+		return sieve( self.congruences, self.lcm )
+
+	def coverage_counts(self):
+		'''Returns a bytearray with the number of congruences covering each integer up to the lcm'''
+		if self.counts is not None:
+			return bytearray( self.counts )
+
+		return coverage_counts( self.congruences, self.lcm )
+
 	def uncovered(self):
 		'''Lists the numbers that are not covered by the covering'''
-		l = []
-		for i in xrange( self.lcm ):
-			covered = False
+		if self.counts is not None:
+			return list( zeros( self.counts ) )
 
-			for congruence in self.congruences:
-				if congruence.contains( i ):
-					covered = True
-					break
+		return list( iter_uncovered( self.congruences ) )
 
-			if not covered:
-				l.append( i )
-
-		return l
+	def iter_uncovered( self, start = 0, limit = None, window = WINDOW ):
+		'''Yields the uncovered integers from start up to the lcm, one window at a time'''
+		return iter_uncovered( self.congruences, start, self.lcm, limit, window )
 	
 	def is_covering( self ):
-		'''Checks if all integers up to the lcm are covered'''
-		for i in xrange( self.lcm ):
-			if not any(map( lambda x: x.contains(i), self.congruences)): 
-				return False
-	
-		return True
+		'''
+		Checks if all integers up to the lcm are covered. An lcm above
+		SIEVE_LIMIT is checked with prime_power_witness.
+		'''
+		if self.counts is not None:
+			return self.uncovered_count == 0
+
+		if self.lcm > SIEVE_LIMIT:
+			return prime_power_witness( self.congruences ) is None
+
+		return '\x00' not in self.sieve()
+
+	def witness( self ):
+		'''Returns an integer that is not covered, or None if this is a covering'''
+		return prime_power_witness( self.congruences )
 
 	def maximum_coverage( self ):
 		'''Returns the sum of the recipricals of the moduli'''
@@ -207,31 +569,83 @@ def greedy_covering( moduli, start = 0 ):
 	'start' dictates which integer is checked first for the covering.
 	Moduli are utilized in the order of the 'moduli' iterable
 	'''
-	lcm_of_moduli = lcm( moduli )
-	uncovered = range( lcm_of_moduli )
 	covering = Covering()
+	covering.fill( greedy_residues( moduli, start )[0] )
+	return covering
+
+def greedy_residues( moduli, start = 0 ):
+	'''
+	Greedily picks a residue for each modulus in turn and returns the
+	(residue, modulus) pairs of greedy_covering and the number of
+	integers up to the lcm left uncovered.
+
+	The uncovered integers are kept as a bitmap, so the number each
+	residue class would cover is counted from one strided slice of it,
+	giving a histogram over the 'modulus' classes instead of trying
+	every residue up to the lcm.
+	'''
+	moduli = list( moduli )
+	lcm_of_moduli = lcm( moduli )
+	covered = bytearray( lcm_of_moduli )
+	ones = bytearray( '\x01' ) * ( lcm_of_moduli // min( moduli ) )
+	residues = []
 	
 	#For each modulus
 	for modulus in moduli:
+		counts = [covered[k::modulus].count( '\x00' ) for k in xrange( modulus )]
+		
+		#The first residue from start with the largest count, or 0 if
+		#nothing is left to cover
 		best_residue = 0
 		best_count   = 0
-		
-		congruence = Congruence( start%modulus, modulus )
-
-		#Look at all possible residues
-		for residue in xrange( start, start + lcm_of_moduli ):
-			congruence.residue = residue % modulus
-			count = len( congruence.filter( uncovered ) )
-		
-			#check if this is the best residue so far
-			if count > best_count:
+		for residue in xrange( start, start + modulus ):
+			if counts[residue % modulus] > best_count:
 				best_residue = residue
-				best_count = count
+				best_count = counts[residue % modulus]
 		
 		#Add best congruence to the system
-		covering.add( best_residue, modulus )
+		residues.append( ( best_residue, modulus ) )
 		
 		#Update which integers need to be covered
-		congruence.residue = best_residue % modulus
-		uncovered = list( set(uncovered) - set(congruence.filter( uncovered )))
+		k = best_residue % modulus
+		covered[k::modulus] = ones[:lcm_of_moduli // modulus]
+	
+	return residues, covered.count( '\x00' )
+
+def greedy_task( task ):
+	'''Runs greedy_residues for one ordering and start. Runs in a worker process.'''
+	moduli, start = task
+	residues, uncovered_count = greedy_residues( moduli, start )
+	return uncovered_count, residues
+
+def multi_start_greedy_covering( moduli, starts = None, orderings = None, shuffles = 0, seed = 0, workers = None ):
+	'''
+	Runs greedy_covering for every start value with every ordering of
+	the moduli on a pool of worker processes, and returns the covering
+	that leaves the fewest integers uncovered, the first one on ties.
+
+	The starts default to 0 up to the largest modulus, and the
+	orderings to the given order. 'shuffles' more orderings are drawn
+	with random.Random(seed).
+	'''
+	moduli = list( moduli )
+	if starts is None:
+		starts = range( max( moduli ) )
+	if orderings is None:
+		orderings = [moduli]
+	orderings = [list( ordering ) for ordering in orderings]
+	
+	rand = random.Random( seed )
+	for _ in xrange( shuffles ):
+		ordering = list( moduli )
+		rand.shuffle( ordering )
+		orderings.append( ordering )
+	
+	tasks = [( ordering, start ) for ordering in orderings for start in starts]
+	results = pool_map( greedy_task, tasks, workers )
+	
+	best = min( xrange( len( results ) ), key = lambda i: ( results[i][0], i ) )
+	
+	covering = Covering()
+	covering.fill( results[best][1] )
 	return covering
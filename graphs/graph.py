@@ -15,25 +15,30 @@ The data structure of 'graph' used in this file is as follows:
    'graph["edges"][v] contains a set where each element in 
       the set implies the edge v to that element exists in
       the graph.
+
+A graphcsr.CSRGraph can be used wherever a 'graph' is
+expected, since it gives the same 'vertexes' and 'edges'
+entries.
 '''
 
 from collections import namedtuple
 
-Edge = namedtuple('Edge', ['from', 'to'])
+Edge = namedtuple('Edge', ['fromVertex', 'toVertex'])
 
 
-import copy
 from collections import deque
+from cStringIO import StringIO
 import string
 import math
+import sys
 
 def disconnectedComponents(graph):
-'''When given a graph, this method looks for the connected
-components of the graph that are disconnected from each other
-and returns the sets in a list.
+    '''When given a graph, this method looks for the connected
+    components of the graph that are disconnected from each other
+    and returns the sets in a list.
 
-USES: deque
-'''
+    USES: deque
+    '''
     explored = set()
     clusters = list()
     
@@ -62,14 +67,94 @@ USES: deque
     
     return clusters
 
+class ComponentTracker:
+    '''Keeps the connected components of a graph up to date while
+    edges are removed from it.
+
+    The components are kept in the list 'clusters', which is
+    updated in place. When an edge (a, b) is removed, only the
+    component that contained it is searched: two breadth first
+    searches start from a and b at once, and the split is found
+    as soon as one of them runs out of vertices. If the searches
+    meet, the component is still whole.
+
+    USES: deque
+    '''
+    
+    def __init__(self, graph, clusters=None):
+        '''Tracks the components of graph, which may be given if
+        they are already known'''
+        if clusters is None:
+            clusters = disconnectedComponents(graph)
+            
+        self.graph = graph
+        self.clusters = clusters
+        self.index = dict()
+        
+        for i, cluster in enumerate(clusters):
+            for vertex in cluster:
+                self.index[vertex] = i
+    
+    def component(self, vertex):
+        '''Returns the component containing the vertex'''
+        return self.clusters[self.index[vertex]]
+    
+    def removeEdge(self, a, b):
+        '''Updates the components after the edge between a and b
+        has been removed from the graph. Returns the set of vertices
+        that broke away, or None if the component is still whole.
+        '''
+        part = self.search(a, b)
+        
+        if part is None:
+            return None
+        
+        i = self.index[a]
+        self.clusters[i] = self.clusters[i] - part
+        
+        newIndex = len(self.clusters)
+        self.clusters.append(part)
+        
+        for vertex in part:
+            self.index[vertex] = newIndex
+            
+        return part
+    
+    def search(self, a, b):
+        '''Runs a breadth first search from a and from b, one vertex
+        at a time each. Returns the vertices of whichever search is
+        exhausted first, or None if the searches meet.
+        '''
+        if a == b:
+            return None
+        
+        edges = self.graph['edges']
+        searches = [(deque([a]), set([a])), (deque([b]), set([b]))]
+        
+        while True:
+            for side in (0, 1):
+                queue, explored = searches[side]
+                otherExplored = searches[1 - side][1]
+                
+                if not queue:
+                    return explored
+                
+                vertex = queue.popleft()
+                for toVertex in edges[vertex]:
+                    if toVertex in otherExplored:
+                        return None
+                    if toVertex not in explored:
+                        explored.add(toVertex)
+                        queue.append(toVertex)
+
 def toLatexHierarchy(vertexSet,clusterList):
-'''INCOMPLETE
+    '''INCOMPLETE
 
-This method was initially created to create a Tikz hierarchy
-in order to visual the clustering. However, it was not
-required for the project and development was cancelled. It
-remains here if further work is done.
-'''
+    This method was initially created to create a Tikz hierarchy
+    in order to visual the clustering. However, it was not
+    required for the project and development was cancelled. It
+    remains here if further work is done.
+    '''
     height = 0.5
     width = 1
     
@@ -99,10 +184,10 @@ remains here if further work is done.
     f.close()
 
 def subHierarchy(cluster, clusterList, depth):
-'''INCOMPLETE
+    '''INCOMPLETE
 
-For use by the toLatexHierarchy method only
-'''
+    For use by the toLatexHierarchy method only
+    '''
     result = ''
     tab = string.join(['    '] * depth)
     #print 'Creating sub hierarchy for ', cluster
@@ -119,14 +204,39 @@ For use by the toLatexHierarchy method only
     
 #-----------------------------------------------------------
 
-def toLatexColoredClusters(clusters, graph, colorMap, confName, colorlist):
-'''This method, when given clusters, a graph, a color map,
-a cluster name mape, and a color list produces the figures
-seen in the proof of concept figures in the final paper
+def undirectedEdges(graph, vertlist):
+    '''Yields each undirected edge of the graph once, as the
+    pair (i, j) of its positions in vertlist with i < j. Used by
+    the Tikz methods instead of removing edges from a copy.
+    '''
+    index = dict((vertex, i) for i, vertex in enumerate(vertlist))
+    
+    for i, vertex in enumerate(vertlist):
+        for toVertex in graph['edges'][vertex]:
+            j = index.get(toVertex, -1)
+            if j > i:
+                yield i, j
 
-USES: copy, math
-'''
-    result = '''\documentclass{article}
+#-----------------------------------------------------------
+
+def toLatexColoredClusters(clusters, graph, colorMap, confName, colorlist,
+                           out=None):
+    '''This method, when given clusters, a graph, a color map,
+    a cluster name mape, and a color list produces the figures
+    seen in the proof of concept figures in the final paper
+
+    The picture is written to the file-like object out as it is
+    produced. If out is not given, it is returned as a string.
+
+    USES: cStringIO, math
+    '''
+    if out is None:
+        result = StringIO()
+        toLatexColoredClusters(clusters, graph, colorMap, confName,
+                               colorlist, result)
+        return result.getvalue()
+    
+    out.write('''\documentclass{article}
 \usepackage{color}
 \usepackage[usenames,dvipsnames]{xcolor}
 \usepackage{tikz}
@@ -140,7 +250,7 @@ USES: copy, math
 \\begin{tikzpicture}[thick]
 \\tikzstyle{every node}=[circle,draw=black,fill=red] {};
 
-'''
+''')
     centerStep = 360 / float(len(clusters))
     
     circleDiameter = '2cm'
@@ -151,25 +261,21 @@ USES: copy, math
         center = (math.cos(math.radians(centerStep * i)) * 12,
                   math.sin(math.radians(centerStep * i)) * 12)
         
-        result += '\\begin{scope}' + '[xshift={0:.2f}cm, yshift={1:.2f}cm]'.format(center[0],center[1])
+        out.write('\\begin{scope}' + '[xshift={0:.2f}cm, yshift={1:.2f}cm]'.format(center[0],center[1]))
         
         size = float(len(cluster))
         step = 360 / size
         
         for j, vert in enumerate(cluster):
-            result += '\t\\node [fill={4}] ({0}) at ({1}:{2}) {3};\n'.format(clusterindex,step * j,circleDiameter, '{}', colorMap[vert])
+            out.write('\t\\node [fill={4}] ({0}) at ({1}:{2}) {3};\n'.format(clusterindex,step * j,circleDiameter, '{}', colorMap[vert]))
             clusterindex += 1
         
-        result += '\\end{scope}'
+        out.write('\\end{scope}')
         
-    tmpgraph = copy.deepcopy(graph)
     vertlist = list(graph['vertexes'])
     
-    for i in xrange(0,len(vertlist)):
-        for j in tmpgraph['edges'][vertlist[i]]:
-            tmpgraph['edges'][j].remove(vertlist[i])
-            result += '\n\\draw ({0}) -- ({1});'.format(i,
-               vertlist.index(j))
+    for i, j in undirectedEdges(graph, vertlist):
+        out.write('\n\\draw ({0}) -- ({1});'.format(i, j))
         
         
     prevConf = None
@@ -179,27 +285,33 @@ USES: copy, math
         
         
         if not prevConf:
-            result += '\n\\node [fill={0}, rectangle] ({1}) {2};'.format(colorlist[key-1], name, '{' + name + '}')
+            out.write('\n\\node [fill={0}, rectangle] ({1}) {2};'.format(colorlist[key-1], name, '{' + name + '}'))
         else:
-            result += '\n\\node [fill={0}, rectangle] ({1}) [below of={3}]{2};'.format(colorlist[key-1], name, '{' + name + '}', prevConf)
+            out.write('\n\\node [fill={0}, rectangle] ({1}) [below of={3}]{2};'.format(colorlist[key-1], name, '{' + name + '}', prevConf))
         
         prevConf = name
         
-    result += '\n\n\\end{tikzpicture}\n\\end{document}'
-        
-    return result
+    out.write('\n\n\\end{tikzpicture}\n\\end{document}')
     
 #-----------------------------------------------------------
 
-def toLatexClusters(clusters, graph):
-'''This method, when given a set of clusters and a graph,
-produces a Tikz picture that visualizes the graph as a
-circle of clusters, each of which is a circle of the cluster's
-vertices.
-
-USER: copy, math
-'''
-    result = '''\documentclass{article}
+def toLatexClusters(clusters, graph, out=None):
+    '''This method, when given a set of clusters and a graph,
+    produces a Tikz picture that visualizes the graph as a
+    circle of clusters, each of which is a circle of the cluster's
+    vertices.
+
+    The picture is written to the file-like object out as it is
+    produced. If out is not given, it is returned as a string.
+
+    USES: cStringIO, math
+    '''
+    if out is None:
+        result = StringIO()
+        toLatexClusters(clusters, graph, result)
+        return result.getvalue()
+    
+    out.write('''\documentclass{article}
 \usepackage{color}
 \usepackage[usenames,dvipsnames]{xcolor}
 \usepackage{tikz}
@@ -213,7 +325,7 @@ USER: copy, math
 \\begin{tikzpicture}[thick]
 \\tikzstyle{every node}=[circle,draw=black,fill=red] {};
 
-'''
+''')
     centerStep = 360 / float(len(clusters))
     
     circleDiameter = '2cm'
@@ -224,44 +336,42 @@ USER: copy, math
         center = (math.cos(math.radians(centerStep * i)) * 4,
                   math.sin(math.radians(centerStep * i)) * 4)
         
-        result += '\\begin{scope}' + '[xshift={0:.2f}cm, yshift={1:.2f}cm]'.format(center[0],center[1])
+        out.write('\\begin{scope}' + '[xshift={0:.2f}cm, yshift={1:.2f}cm]'.format(center[0],center[1]))
         
         size = float(len(cluster))
         step = 360 / size
         
         for j, vert in enumerate(cluster):
-            result += '\t\\node ({0}) at ({1}:{2}) {3};\n'.format(vert,step * j,circleDiameter, '{}')
+            out.write('\t\\node ({0}) at ({1}:{2}) {3};\n'.format(vert,step * j,circleDiameter, '{}'))
         
-        result += '\\end{scope}'
+        out.write('\\end{scope}')
         
-    tmpgraph = copy.deepcopy(graph)
     vertlist = list(graph['vertexes'])
     
-    for i in xrange(0,len(vertlist)):
-        for j in tmpgraph['edges'][vertlist[i]]:
-            tmpgraph['edges'][j].remove(vertlist[i])
-            result += '\n\\draw ({0}) -- ({1});'.format(vertlist[i],
-               j)
+    for i, j in undirectedEdges(graph, vertlist):
+        out.write('\n\\draw ({0}) -- ({1});'.format(vertlist[i],
+           vertlist[j]))
 
-    result += '\n\n\\end{tikzpicture}\n\\end{document}'
-        
-    return result   
+    out.write('\n\n\\end{tikzpicture}\n\\end{document}')
  
 #-----------------------------------------------------------
 
-def toLatex(graph):
-'''This method, when given a graph, prints the contents of
-a Tikz image that shows the graph with the vertices in a
-circle.
+def toLatex(graph, out=None):
+    '''This method, when given a graph, prints the contents of
+    a Tikz image that shows the graph with the vertices in a
+    circle. If the file-like object out is given, the image is
+    written to it instead.
 
-USES: copy, math
-'''
+    USES: math, sys
+    '''
+    if out is None:
+        out = sys.stdout
+    
     vertlist = list(graph['vertexes'])
-    tmpgraph = copy.deepcopy(graph)
     size = len(vertlist)
     circleDiameter = '4cm'
     step = 360 / size;
-    result = '''\documentclass{article}
+    out.write('''\documentclass{article}
 \usepackage{tikz}
 
 \usepackage[active,pdftex,tightpage]{preview}
@@ -273,15 +383,11 @@ USES: copy, math
 \\begin{tikzpicture}[thick]
 \\tikzstyle{commonnode}=[circle,draw=black,fill=red] {};
 
-'''
+''')
     for i in xrange(0,size):
-        result += '\\node ({0}) at ({1}:{2}) [commonnode] {3};\n'.format(i,step * i,circleDiameter, '{}')
+        out.write('\\node ({0}) at ({1}:{2}) [commonnode] {3};\n'.format(i,step * i,circleDiameter, '{}'))
         
-    for i in xrange(0,size):
-        for j in tmpgraph['edges'][vertlist[i]]:
-            tmpgraph['edges'][j].remove(vertlist[i])
-            result += '\n\\draw ({0}) -- ({1});'.format(i,
-               vertlist.index(j))
+    for i, j in undirectedEdges(graph, vertlist):
+        out.write('\n\\draw ({0}) -- ({1});'.format(i, j))
             
-    result += '\n\n\\end{tikzpicture}\n\\end{document}'
-    print result
+    out.write('\n\n\\end{tikzpicture}\n\\end{document}\n')
@@ -0,0 +1,284 @@
+'''module graphbenchmark
+This module times the clustering methods on a fixed set of
+graphs so that runs of different versions can be compared.
+
+The graphs are seeded graphtest.generatePlantedL graphs over a
+sweep of sizes and p/q values, the Karate Club graph of
+graphtest.create_test and, if its files are found, the FBS
+graph read as in sportgraphtext. For each graph the suite
+times
+
+   disconnectedComponents, allShortestPaths over a sample of
+   vertex pairs, updateEdgeValues over every vertex,
+   suggestedModularity and the full graphcluster.cluster
+
+records the peak memory of the process, and scores the best
+clustering against the planted groups or the FBS conferences
+with the normalized mutual information (NMI). Each graph runs
+in its own worker process, so the peak memory of one does not
+hide the next. runSuite writes the results as JSON.
+
+Run from the command line as
+
+   python graphbenchmark.py results.json [--fbs sportsgraph]
+
+USES: graph, graphcluster, graphtest, multiprocessing,
+      resource, timeit, random, math, json, platform, os, time
+'''
+
+from graph import disconnectedComponents
+from graphcluster import allShortestPaths, updateEdgeValues, suggestedModularity
+import graphcluster
+import graphtest
+from multiprocessing import Pool
+from timeit import default_timer
+import resource
+import random
+import math
+import json
+import platform
+import os
+import time
+
+#Sizes, cluster counts and p/q values of the planted graphs
+PLANTED = [(vertCount, 4, p, q)
+           for vertCount in (32, 64, 128)
+           for p, q in ((0.5, 0.02), (0.5, 0.05), (0.3, 0.05))]
+
+#-----------------------------------------------------------
+
+def runSuite(filepath, planted=PLANTED, seeds=(0,), fbs='sportsgraph',
+             repeat=3, pairs=100, label=None):
+    '''Benchmarks the karate graph, a planted graph for each
+    entry of planted and seed, and the FBS graph read from the
+    fbs directory if it exists, and writes the results to
+    filepath as JSON. The label is stored with the results to
+    tell runs apart. Returns the results.
+    '''
+    cases = [{'name': 'karate', 'kind': 'karate'}]
+
+    for vertCount, clusters, p, q in planted:
+        for seed in seeds:
+            name = 'planted-{0}-{1}-{2}-{3}-{4}'.format(vertCount, clusters,
+                                                       p, q, seed)
+            cases.append({'name': name, 'kind': 'planted', 'seed': seed,
+                          'args': [vertCount, clusters, p, q]})
+
+    if fbs is not None and os.path.isdir(fbs):
+        cases.append({'name': 'fbs', 'kind': 'fbs', 'directory': fbs})
+
+    for case in cases:
+        case['repeat'] = repeat
+        case['pairs'] = pairs
+
+    #A fresh process for each case, so ru_maxrss is its own peak
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        results = list()
+        for case in cases:
+            print 'Benchmarking', case['name']
+            results.append(pool.apply(runCase, (case,)))
+    finally:
+        pool.close()
+        pool.join()
+
+    suite = dict()
+    suite['label'] = label
+    suite['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    suite['python'] = platform.python_version()
+    suite['platform'] = platform.platform()
+    suite['cases'] = results
+
+    with open(filepath, 'w') as f:
+        json.dump(suite, f, indent=1, sort_keys=True)
+
+    return suite
+
+#-----------------------------------------------------------
+
+def runCase(case):
+    '''Builds the graph of a case and benchmarks it. Runs in a
+    worker process.
+    '''
+    baseMemory = peakMemory()
+
+    if case['kind'] == 'planted':
+        random.seed(case['seed'])
+        grph = graphtest.generatePlantedL(*case['args'])
+        truth = plantedTruth(case['args'][0], case['args'][1])
+    elif case['kind'] == 'fbs':
+        grph, truth = loadFBS(case['directory'])
+    else:
+        grph = graphtest.create_test()
+        truth = None
+
+    result = benchmarkGraph(grph, truth, case['repeat'], case['pairs'],
+                            case.get('seed', 0))
+    result['name'] = case['name']
+    result['baseMemoryKB'] = baseMemory
+
+    return result
+
+def benchmarkGraph(grph, truth=None, repeat=3, pairs=100, seed=0):
+    '''Times the clustering methods on the graph and returns a
+    dictionary of the results. The fast methods are timed repeat
+    times and the best time is kept. truth, if given, maps each
+    vertex to its true group.
+    '''
+    result = dict()
+
+    edgeValues = dict()
+    for vertex in grph['vertexes']:
+        for toVertex in grph['edges'][vertex]:
+            edgeValues[frozenset([vertex, toVertex])] = 0
+
+    result['vertexes'] = len(grph['vertexes'])
+    result['edges'] = len(edgeValues)
+
+    #Pairs of vertices to find the shortest paths between
+    rand = random.Random(seed)
+    verts = sorted(grph['vertexes'])
+    pathPairs = [(rand.choice(verts), rand.choice(verts))
+                 for i in xrange(pairs)]
+
+    def shortestPaths():
+        for start, end in pathPairs:
+            allShortestPaths(grph, start, end)
+
+    times = dict()
+    times['disconnectedComponents'] = bestTime(repeat, disconnectedComponents, grph)
+    times['allShortestPaths'] = bestTime(repeat, shortestPaths)
+    times['updateEdgeValues'] = bestTime(repeat, updateEdgeValues,
+                                         grph['vertexes'], grph, edgeValues)
+
+    start = default_timer()
+    clusters, cutData, hierarchy = graphcluster.cluster(grph)
+    times['cluster'] = default_timer() - start
+
+    times['suggestedModularity'] = bestTime(repeat, suggestedModularity,
+                                            clusters, grph)
+
+    result['times'] = times
+    result['clusters'] = len(clusters)
+    result['modularity'] = suggestedModularity(clusters, grph)
+
+    if truth is not None:
+        result['nmi'] = normalizedMutualInformation(clusters, truth)
+
+    result['peakMemoryKB'] = peakMemory()
+
+    return result
+
+def bestTime(repeat, method, *args):
+    '''Returns the shortest wall time of repeat calls of the method'''
+    best = None
+    for i in xrange(repeat):
+        start = default_timer()
+        method(*args)
+        elapsed = default_timer() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+def peakMemory():
+    '''Returns the peak resident memory of this process in
+    kilobytes, as reported by getrusage on Linux
+
+    USES: resource
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#-----------------------------------------------------------
+
+def plantedTruth(vertCount, clusters):
+    '''Returns the planted group of each vertex of a
+    generatePlantedL graph'''
+    return dict((v, (v - 1) % clusters) for v in xrange(1, vertCount + 1))
+
+def loadFBS(directory='sportsgraph'):
+    '''Reads the FBS graph as sportgraphtext does and returns the
+    graph and the conference of each team'''
+    grph = dict()
+    grph['vertexes'] = set()
+    grph['edges'] = dict()
+
+    confMap = dict()
+
+    with open(os.path.join(directory, 'fbs2012teams.txt')) as f:
+        for line in f:
+            data = line.split()
+
+            index = int(data[0])
+            grph['vertexes'].add(index)
+            grph['edges'][index] = set()
+            confMap[index] = int(data[1])
+
+    with open(os.path.join(directory, 'fbs2012games.txt')) as f:
+        for line in f:
+            data = line.split()
+
+            teamA = int(data[0])
+            teamB = int(data[1])
+
+            grph['edges'][teamA].add(teamB)
+            grph['edges'][teamB].add(teamA)
+
+    return grph, confMap
+
+def normalizedMutualInformation(clusters, truth):
+    '''Returns the normalized mutual information 2I(X;Y)/(H(X)+H(Y))
+    between the clusters and the true group of each vertex given
+    by truth. It is 1 when the clusters are the true groups.
+
+    USES: math
+    '''
+    joint = dict()
+    for label, cluster in enumerate(clusters):
+        for vertex in cluster:
+            key = (label, truth[vertex])
+            joint[key] = joint.get(key, 0) + 1
+
+    total = float(sum(joint.itervalues()))
+    if total == 0:
+        return 0.0
+
+    found = dict()
+    true = dict()
+    for (label, group), count in joint.iteritems():
+        found[label] = found.get(label, 0) + count
+        true[group] = true.get(group, 0) + count
+
+    information = 0.0
+    for (label, group), count in joint.iteritems():
+        information += count / total * math.log(count * total / (found[label] * true[group]))
+
+    entropy = 0.0
+    for counts in (found, true):
+        for count in counts.itervalues():
+            entropy -= count / total * math.log(count / total)
+
+    if entropy == 0:
+        return 1.0
+
+    return 2 * information / entropy
+
+#-----------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark graph clustering.')
+    parser.add_argument('output', help='The JSON file to write.')
+    parser.add_argument('--fbs', default='sportsgraph',
+                        help='The directory of the FBS files.')
+    parser.add_argument('--seeds', type=int, default=1,
+                        help='The number of seeds of each planted graph.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--label', default=None)
+
+    args = parser.parse_args()
+
+    runSuite(args.output, seeds=range(args.seeds), fbs=args.fbs,
+             repeat=args.repeat, label=args.label)
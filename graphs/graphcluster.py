@@ -1,23 +1,44 @@
 '''module graphcluster
 The methods in the module perform edge-betweenness clustering.
 
-USES: graph, collections, itertools, operator, copy
+USES: graph, graphparallel, collections, itertools, array,
+      operator, heapq, random, math, copy, cPickle, os, timeit
 '''
 
-from graph import disconnectedComponents
-from collections import deque
+from graph import disconnectedComponents, ComponentTracker
+from graphparallel import ParallelBetweenness
+from collections import deque, namedtuple
 from itertools import combinations
+from array import array
 import operator
+import heapq
+import random
+import math
 import copy
+import cPickle
+import os
+from timeit import default_timer
 
+#Edge values closer than this, relative to their size, are
+#ties, as summing in another order can change the last bits
+TIE_TOLERANCE = 1e-9
+
+#What cluster passes to its observers after each removal.
+#startComponents is the number of components before the first
+#removal of the call, and times holds the wall time of the
+#'removal', 'components', 'modularity' and 'betweenness' phases
+#of the iteration.
+ClusterEvent = namedtuple('ClusterEvent', ['iteration', 'total', 'edge',
+                                           'components', 'modularity',
+                                           'times', 'startComponents'])
 #-----------------------------------------------------------
 
 def suggestedModularity(clusters, basegraph):
-'''If given a graph whose components give the clusters,
-it calculates the modularity suggested by Newman and
-Girvan when they introduced edge betweenness clustering
-in 2003.
-'''
+    '''If given a graph whose components give the clusters,
+    it calculates the modularity suggested by Newman and
+    Girvan when they introduced edge betweenness clustering
+    in 2003.
+    '''
     modularity = 0
     
     #Calculate total edges
@@ -58,17 +79,153 @@ in 2003.
     return modularity
     
 #-----------------------------------------------------------
+
+class ModularityTracker:
+    '''Keeps the modularity suggested by Newman and Girvan up to
+    date while the components of a graph split apart.
+
+    For each cluster it stores the number of edge ends inside the
+    cluster and the degree sum in the base graph. When a cluster
+    splits, only the part that broke off is scanned, so each
+    update costs O(size of the part) and reading the modularity
+    is O(1). The base graph must be undirected.
+    '''
+    
+    def __init__(self, basegraph, clusters):
+        '''Starts tracking the given clusters of basegraph'''
+        self.basegraph = basegraph
+        self.label = dict()
+        self.internal = list()
+        self.degree = list()
+        
+        for label, cluster in enumerate(clusters):
+            for vertex in cluster:
+                self.label[vertex] = label
+        
+        self.edgeEnds = 0
+        self.internalSum = 0
+        self.degreeSquares = 0
+        
+        for label, cluster in enumerate(clusters):
+            internal, degree = self.scan(cluster, label)
+            self.internal.append(internal)
+            self.degree.append(degree)
+            
+            self.edgeEnds += degree
+            self.internalSum += internal
+            self.degreeSquares += degree * degree
+    
+    def scan(self, cluster, label):
+        '''Counts the edge ends of the cluster that stay inside it
+        and the cluster's degree sum'''
+        internal = 0
+        degree = 0
+        
+        for vertex in cluster:
+            edges = self.basegraph['edges'][vertex]
+            degree += len(edges)
+            for toVertex in edges:
+                if self.label[toVertex] == label:
+                    internal += 1
+                    
+        return internal, degree
+    
+    def split(self, part):
+        '''Records that the vertices in part broke away from the
+        cluster that contained them'''
+        for vertex in part:
+            oldLabel = self.label[vertex]
+            break
+        else:
+            return
+        
+        newLabel = len(self.degree)
+        for vertex in part:
+            self.label[vertex] = newLabel
+        
+        #Edge ends from the part to the rest of the old cluster
+        cut = 0
+        internal = 0
+        degree = 0
+        
+        for vertex in part:
+            edges = self.basegraph['edges'][vertex]
+            degree += len(edges)
+            for toVertex in edges:
+                label = self.label[toVertex]
+                if label == newLabel:
+                    internal += 1
+                elif label == oldLabel:
+                    cut += 1
+        
+        oldInternal = self.internal[oldLabel]
+        oldDegree = self.degree[oldLabel]
+        restInternal = oldInternal - internal - 2 * cut
+        restDegree = oldDegree - degree
+        
+        self.internal[oldLabel] = restInternal
+        self.degree[oldLabel] = restDegree
+        self.internal.append(internal)
+        self.degree.append(degree)
+        
+        self.internalSum += restInternal + internal - oldInternal
+        self.degreeSquares += (restDegree * restDegree
+                               + degree * degree
+                               - oldDegree * oldDegree)
+    
+    def modularity(self):
+        '''Returns the modularity of the tracked clusters'''
+        if self.edgeEnds == 0:
+            return 0
+            
+        edgeEnds = float(self.edgeEnds)
+        return (self.internalSum / edgeEnds
+                - self.degreeSquares / (edgeEnds * edgeEnds))
+    
+#-----------------------------------------------------------
     
-def cluster(graph, modularity=suggestedModularity):
-'''When given a graph, this method performs edge-betweenness
-clustering based on the provided modularity, which by default
-is the suggestedModularity method. This method returns a
-results list where
+def cluster(graph, modularity=suggestedModularity,
+            betweenness=None, workers=1, samples=None, seed=0,
+            maxSamples=None, checkpoint=None, checkpointInterval=100, observers=None):
+    '''When given a graph, this method performs edge-betweenness
+    clustering based on the provided modularity, which by default
+    is the suggestedModularity method, kept up to date with a
+    ModularityTracker instead of being recomputed after each
+    removal. Any other modularity is recomputed from the clusters
+    every time.
 
-result[0] is the cluster that maximizes the modularity
-result[1] is the value of each clustering's modularity
-result[2] contains hierarchy data and is deprecated.
-'''
+    The edge-betweenness is computed by the provided betweenness
+    method, which by default is updateEdgeValues.
+    enumeratedEdgeValues may be given instead to cross-check the
+    results. If workers is more than one, the default betweenness
+    is computed by a pool of that many processes. If samples is
+    given, the betweenness is instead estimated from that many
+    random source vertices chosen with the given seed (see
+    SampledBetweenness), growing the sample up to maxSamples
+    sources where the top edges are close. Each row of result[1]
+    then also holds the sample size and the estimated error bound
+    of the removed edge, or of the top edge in the first row.
+
+    If a checkpoint file path is given, the state of the run is
+    saved to it every checkpointInterval removals and when the
+    run finishes. If the file already exists when the method is
+    called, the run resumes from it and gives the same results
+    as an uninterrupted run.
+
+    Each of the observers, if any are given, is called with a
+    ClusterEvent after every removal, holding the removed edge,
+    the number of components, the modularity and the time spent
+    in each phase. The graphobserve module has observers for a
+    progress bar, a CSV timing log and total counts. Nothing is
+    timed when there are no observers.
+
+    This method returns a results list where
+
+    result[0] is the cluster that maximizes the modularity
+    result[1] is a CutData of each clustering's modularity
+    result[2] is a Dendrogram of the splits, which can be indexed
+              like a list of the clusterings at each level
+    '''
     #Calculate Number of edges
     edgeCount = 0
     
@@ -79,69 +236,566 @@ result[2] contains hierarchy data and is deprecated.
         for toVertex in graph['edges'][vertex]:
             edgeSet.add(frozenset([vertex, toVertex]))
     
-    edgeValues = dict()
+    edgeValues = EdgeValueHeap()
     for edge in edgeSet:
         edgeValues[edge] = 0
     
     edgeCount = len(edgeSet)
     
-    bestClusters = disconnectedComponents(graph)
-    bestModularity = modularity(bestClusters, graph)
-    previousClusters = bestClusters
-    
     tmpgraph = copy.deepcopy(graph)
     
-    updateEdgeValues(graph['vertexes'], graph, edgeValues)
+    pool = None
+    if betweenness is None:
+        if samples is not None:
+            betweenness = SampledBetweenness(samples, seed, maxSamples)
+        elif workers > 1:
+            betweenness = pool = ParallelBetweenness(graph, workers)
+        else:
+            betweenness = updateEdgeValues
     
-    #For Debugging and nice pictures, include cut data
-    cutData = [0] * (edgeCount + 1)
-    cutData[0] = [len(bestClusters), bestModularity]
+    #Stop the worker processes even if the run fails
+    try:
+        sampled = hasattr(betweenness, 'sampleSize')
+        
+        if checkpoint is not None and os.path.exists(checkpoint):
+            state = loadCheckpoint(checkpoint)
+            
+            if state['edgeCount'] != edgeCount:
+                raise ValueError('Checkpoint is for another graph: ' + checkpoint)
+            
+            first = state['iteration']
+            removed = state['removed']
+            for a, b in removed:
+                removeUndirectedEdge(tmpgraph, a, b)
+            
+            edgeValues = EdgeValueHeap()
+            for edge, value in state['edgeValues'].iteritems():
+                edgeValues[edge] = value
+            
+            bestClusters = state['bestClusters']
+            bestModularity = state['bestModularity']
+            cutData = state['cutData']
+            hierarchy = state['hierarchy']
+            clusters = state['clusters']
+            
+            if sampled:
+                betweenness.random.setstate(state['random'])
+                betweenness.sampleSize, betweenness.errorBound = state['estimate']
+                betweenness.estimates = state['estimates']
+            
+        else:
+            first = 0
+            removed = list()
+            clusters = disconnectedComponents(graph)
+            bestClusters = list(clusters)
+            
+        tracker = None
+        if modularity is suggestedModularity:
+            tracker = ModularityTracker(graph, clusters)
+            
+        if first == 0:
+            if tracker:
+                bestModularity = tracker.modularity()
+            else:
+                bestModularity = modularity(bestClusters, graph)
+            
+            betweenness(graph['vertexes'], graph, edgeValues)
+            
+            #For Debugging and nice pictures, include cut data
+            cutData = CutData()
+            
+            if sampled:
+                cutData.append([len(bestClusters), bestModularity,
+                                betweenness.sampleSize, betweenness.errorBound])
+            else:
+                cutData.append([len(bestClusters), bestModularity])
+            
+            #For pretty pictures, add hierarchical history
+            hierarchy = Dendrogram(bestClusters, bestModularity)
+        
+        #The component list is updated in place as edges are removed
+        components = ComponentTracker(tmpgraph, clusters)
+        
+        #For each edge we have
+        for i in xrange(first, edgeCount):
+            if (checkpoint is not None and i > first
+                    and checkpointInterval and i % checkpointInterval == 0):
+                saveCheckpoint(checkpoint, i, edgeCount, removed, edgeValues,
+                               clusters, bestClusters, bestModularity,
+                               cutData, hierarchy, betweenness)
+            
+            if observers:
+                times = dict()
+                clock = default_timer()
+            
+        	#Remove the most necessary edge (we store it in
+        	#lostEdge for debugging reasons
+            lostEdge = removeMostTraversedEdge(tmpgraph, edgeValues)
+            removed.append(tuple(lostEdge))
+            
+            if sampled:
+                estimate = betweenness.estimate(lostEdge)
+            
+            if observers:
+                times['removal'], clock = lap(clock)
+            
+            part = components.removeEdge(lostEdge[0], lostEdge[1])
+            
+            #This next section is an improvement not discussed
+            #in the paper since it doesn't decrease the runtime
+            #complexity. Only the edges in the clusters holding the
+            #ends of the removed edge need to have their edge
+            #betweenness reevaluated. After a split they are the two
+            #halves, either of which may be the part split off.
+            reevaluate = (components.component(lostEdge[0])
+                          | components.component(lostEdge[1]))
+            
+            if observers:
+                times['components'], clock = lap(clock)
+            
+            if part is not None and tracker:
+                tracker.split(part)
+            
+            if tracker:
+                tmpModularity = tracker.modularity()
+            else:
+                tmpModularity = modularity(clusters, graph)
+            
+            #Update hierarchy
+            if part is not None:
+                hierarchy.split(part, tmpModularity)
+
+            if tmpModularity > bestModularity:
+                bestModularity = tmpModularity
+                bestClusters = list(clusters)
+            
+            if observers:
+                times['modularity'], clock = lap(clock)
+            
+            betweenness(reevaluate, tmpgraph, edgeValues)
+            
+            if sampled:
+                cutData.append([len(clusters), tmpModularity] + estimate)
+            else:
+                cutData.append([len(clusters), tmpModularity])
+            
+            if observers:
+                times['betweenness'], clock = lap(clock)
+                
+                event = ClusterEvent(i, edgeCount, tuple(lostEdge), len(clusters),
+                                     tmpModularity, times, cutData.counts[first])
+                for observer in observers:
+                    observer(event)
+        
+        if checkpoint is not None:
+            saveCheckpoint(checkpoint, edgeCount, edgeCount, removed, edgeValues,
+                           clusters, bestClusters, bestModularity,
+                           cutData, hierarchy, betweenness)
+    finally:
+        if pool is not None:
+            pool.close()
+    
+    return [bestClusters, cutData, hierarchy]
+
+#-----------------------------------------------------------
+
+def lap(clock):
+    '''Returns the time since clock and the current time'''
+    now = default_timer()
+    return now - clock, now
+
+def saveCheckpoint(filepath, iteration, edgeCount, removed, edgeValues,
+                   clusters, bestClusters, bestModularity,
+                   cutData, hierarchy, betweenness):
+    '''Saves the state of a cluster run at the start of the given
+    iteration. The file is written beside the old one and renamed
+    over it, so a crash never leaves a partial checkpoint.
+
+    USES: cPickle, os
+    '''
+    state = dict()
+    state['edgeCount'] = edgeCount
+    state['iteration'] = iteration
+    state['removed'] = removed
+    state['edgeValues'] = dict(edgeValues)
+    state['clusters'] = clusters
+    state['bestClusters'] = bestClusters
+    state['bestModularity'] = bestModularity
+    state['cutData'] = cutData
+    state['hierarchy'] = hierarchy
     
-    #For pretty pictures, add hierarchical history
-    hierarchy = list()
-    hierarchy.append(bestClusters)
-    clusterCount = len(bestClusters)
+    if hasattr(betweenness, 'sampleSize'):
+        state['random'] = betweenness.random.getstate()
+        state['estimate'] = (betweenness.sampleSize, betweenness.errorBound)
+        state['estimates'] = betweenness.estimates
     
-    #For each edge we have
-    for i in xrange(0, edgeCount):
-    	#Remove the most necessary edge (we store it in
-    	#lostEdge for debugging reasons
-        lostEdge = removeMostTraversedEdge(tmpgraph, edgeValues)
-        clusters = disconnectedComponents(tmpgraph)
+    tmppath = filepath + '.tmp'
+    with open(tmppath, 'wb') as f:
+        cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
         
-        #Update hierarchy
-        if len(clusters) > clusterCount:
-            hierarchy.append(clusters)
-            clusterCount = len(clusters)
+    os.rename(tmppath, filepath)
+
+def loadCheckpoint(filepath):
+    '''Loads the state saved by saveCheckpoint
+
+    USES: cPickle
+    '''
+    with open(filepath, 'rb') as f:
+        return cPickle.load(f)
+
+#-----------------------------------------------------------
+
+class Dendrogram:
+    '''The hierarchy of clusterings found by the cluster method,
+    stored as its split events rather than as every clustering.
+
+    Level 0 is the first clustering, whose clusters have the ids
+    0..k-1, and level i is the clustering after i splits. Split i
+    moves part of the cluster parents[i] into the new cluster
+    k + i, so both ids are its children, and modularities[i] is
+    the modularity after it. Each vertex only stores the id of
+    its cluster at the last level, so the memory is O(V) however
+    many levels there are.
+
+    A level is built on request by following the parent ids, in
+    union-find fashion, so the dendrogram can be indexed like
+    the old list of clusterings, as toLatexHierarchy does, and
+    toList gives that list in full.
+
+    USES: array
+    '''
+    
+    def __init__(self, clusters, modularity=0):
+        '''Starts the hierarchy with the given clusters'''
+        self.initial = len(clusters)
+        self.initialModularity = modularity
+        self.label = dict()
+        self.parents = array('l')
+        self.modularities = array('d')
+        self.cache = None
+        
+        for label, cluster in enumerate(clusters):
+            for vertex in cluster:
+                self.label[vertex] = label
+    
+    def split(self, part, modularity=0):
+        '''Records that the vertices in part broke away from their
+        cluster into a new one'''
+        newLabel = self.initial + len(self.parents)
+        
+        for vertex in part:
+            parent = self.label[vertex]
+            break
+        else:
+            return
+        
+        for vertex in part:
+            self.label[vertex] = newLabel
+            
+        self.parents.append(parent)
+        self.modularities.append(modularity)
+        self.cache = None
+    
+    def __getstate__(self):
+        '''Leaves the cached level out of pickles'''
+        state = dict(self.__dict__)
+        state['cache'] = None
+        return state
+    
+    def events(self):
+        '''Iterates over the splits as (parent id, child ids,
+        modularity) tuples'''
+        for i, parent in enumerate(self.parents):
+            yield parent, (parent, self.initial + i), self.modularities[i]
+    
+    def __len__(self):
+        return len(self.parents) + 1
+    
+    def __getitem__(self, level):
+        '''Returns the list of clusters at the given level, or a
+        list of them for a slice of levels'''
+        if isinstance(level, slice):
+            return [self[j] for j in xrange(*level.indices(len(self)))]
+        
+        if level < 0:
+            level += len(self)
+        if level < 0 or level >= len(self):
+            raise IndexError('Dendrogram level out of range')
+        
+        if self.cache is not None and self.cache[0] == level:
+            return self.cache[1]
         
-        tmpModularity = modularity(clusters, graph)
+        #Clusters created after the level are merged back into
+        #their parents
+        limit = self.initial + level
+        root = dict()
+        clusters = [set() for i in xrange(limit)]
+        
+        for vertex, label in self.label.iteritems():
+            if label >= limit:
+                path = list()
+                while label >= limit and label not in root:
+                    path.append(label)
+                    label = self.parents[label - self.initial]
+                label = root.get(label, label)
+                for merged in path:
+                    root[merged] = label
+                    
+            clusters[label].add(vertex)
+        
+        self.cache = (level, clusters)
+        return clusters
+    
+    def __iter__(self):
+        for level in xrange(len(self)):
+            yield self[level]
+    
+    def toList(self):
+        '''Returns the clusters of every level as a list'''
+        return list(self)
+    
+    def __repr__(self):
+        return repr(self.toList())
+
+#-----------------------------------------------------------
+
+class CutData:
+    '''The number of clusters and the modularity after each edge
+    removal of the cluster method, kept in arrays. Each row reads
+    as the list [clusters, modularity], followed by the sample
+    size and error bound when the betweenness was sampled, so it
+    can be used like the old list of rows, as storeResults does.
 
-        if tmpModularity > bestModularity:
-            bestModularity = tmpModularity
-            bestClusters = clusters
+    USES: array
+    '''
+    
+    def __init__(self):
+        self.counts = array('l')
+        self.modularities = array('d')
+        self.sampleSizes = array('l')
+        self.errorBounds = array('d')
+    
+    def append(self, row):
+        '''Adds a row'''
+        self.counts.append(row[0])
+        self.modularities.append(row[1])
         
-        #This next section is an improvement not discussed
-        #in the paper since it doesn't decrease the runtime
-        #complexity. Only the edges in a cluster that has
-        #broken into two need to have their edge betweenness
-        #reevaluated.
-        reevaluate = set()
+        if len(row) > 2:
+            self.sampleSizes.append(row[2])
+            self.errorBounds.append(row[3])
+    
+    def __len__(self):
+        return len(self.counts)
+    
+    def __getitem__(self, i):
+        '''Returns row i, or a list of rows for a slice'''
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(len(self)))]
         
-        for cluster in clusters:
-            if lostEdge[0] in cluster or lostEdge[1] in cluster:
-                reevaluate |= cluster
+        row = [self.counts[i], self.modularities[i]]
+        if self.sampleSizes:
+            row += [self.sampleSizes[i], self.errorBounds[i]]
+        return row
+    
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+    
+    def __repr__(self):
+        return repr(list(self))
+
+#-----------------------------------------------------------
+
+def updateEdgeValues(vertexes, graph, edgeValues, workers=1):
+    '''When given a set of vertices of a graph, this method
+    updates the values in edgeValues for edge-betweenness.
+
+    Instead of listing the shortest paths of every pair, one
+    breadth first search is run from each vertex and the number
+    of shortest paths is counted (Brandes, 2001). Every pair is
+    reached from both of its ends, so the accumulated values are
+    halved. The vertexes should be a union of components of the
+    graph, as they are in the cluster method. Runs in O(V*E).
+
+    If workers is more than one, a ParallelBetweenness pool is
+    started for this call and stopped before it returns.
+    '''
+    if workers > 1:
+        parallel = ParallelBetweenness(graph, workers)
+        try:
+            parallel(vertexes, graph, edgeValues)
+        finally:
+            parallel.close()
+        return
+    
+    vertexes = set(vertexes)
+    
+    #Clear the old values of the edges being reevaluated
+    for vertex in vertexes:
+        for toVertex in graph['edges'][vertex]:
+            edge = frozenset([vertex, toVertex])
+            if edge in edgeValues:
+                edgeValues[edge] = 0
+    
+    values = dict()
+    for vertex in vertexes:
+        accumulateEdgeValues(graph, vertex, vertexes, values)
+    
+    for edge, value in values.iteritems():
+        if edge in edgeValues:
+            edgeValues[edge] = value / float(2)
         
-        updateEdgeValues(reevaluate, tmpgraph, edgeValues)
-        cutData[i + 1] = [len(clusters), tmpModularity] 
+    #No return value since changes made in reference
+
+#-----------------------------------------------------------
+
+def accumulateEdgeValues(graph, start, targets, edgeValues):
+    '''Adds to edgeValues the share of each edge in the shortest
+    paths from start to every vertex of targets. This is the
+    single-source step of updateEdgeValues.
+    '''
+    dag = ShortestPathDag(graph, start)
     
-    return [bestClusters, cutData, hierarchy]
+    #Walk back from the furthest vertices, passing each vertex's
+    #dependency on to its predecessors
+    dependency = dict.fromkeys(dag.order, 0)
+    
+    for vertex in reversed(dag.order):
+        credit = dependency[vertex]
+        if vertex in targets and vertex != start:
+            credit += 1
+            
+        for fromVertex in dag.predecessors[vertex]:
+            share = credit * dag.pathCount[fromVertex] / float(dag.pathCount[vertex])
+            edge = frozenset([fromVertex, vertex])
+            edgeValues[edge] = edgeValues.get(edge, 0) + share
+            dependency[fromVertex] += share
 
 #-----------------------------------------------------------
 
-def updateEdgeValues(vertexes, graph, edgeValues):
-'''When given a set of vertices of a graph, this method
-updates the values in edgeValues for edge-betweenness.
-'''
+class SampledBetweenness:
+    '''Estimates edge-betweenness from the shortest paths of a
+    random sample of source vertices instead of all of them. An
+    instance can be given as the betweenness of the cluster
+    method, as it is called like updateEdgeValues.
+
+    Each call shuffles the vertices with its own seeded random
+    generator and accumulates the paths from the first 'samples'
+    of them, scaling the sums up to the number of vertices. The
+    standard error of the estimate of each edge, times
+    'confidence', is kept with the number of sources used in
+    'estimates', and those of the top edge of the last call in
+    errorBound and sampleSize. If maxSamples is larger than
+    samples, the sample is doubled until the top two edges
+    differ by more than the error bound or maxSamples is
+    reached. Components with no more than 'samples' vertices
+    are computed exactly.
+
+    USES: random, math
+    '''
+    
+    def __init__(self, samples, seed=0, maxSamples=None, confidence=1.96):
+        self.samples = samples
+        self.maxSamples = max(samples, maxSamples or samples)
+        self.confidence = confidence
+        self.random = random.Random(seed)
+        
+        self.sampleSize = 0
+        self.errorBound = 0
+        self.estimates = dict()
+    
+    def estimate(self, edge):
+        '''Returns the sample size and error bound of the last
+        estimate of the edge, given as a pair of vertices'''
+        return list(self.estimates.get(frozenset(edge), (0, 0)))
+    
+    def __call__(self, vertexes, graph, edgeValues):
+        '''Updates the values in edgeValues with estimates of the
+        edge-betweenness of the given vertices'''
+        vertexes = set(vertexes)
+        
+        pivots = sorted(vertexes)
+        self.random.shuffle(pivots)
+        
+        vertexCount = len(pivots)
+        sampleSize = min(self.samples, vertexCount)
+        limit = min(self.maxSamples, vertexCount)
+        
+        sums = dict()
+        squares = dict()
+        used = 0
+        
+        while True:
+            #Add the contributions of the new sources
+            for start in pivots[used:sampleSize]:
+                contribution = dict()
+                accumulateEdgeValues(graph, start, vertexes, contribution)
+                
+                for edge, value in contribution.iteritems():
+                    sums[edge] = sums.get(edge, 0) + value
+                    squares[edge] = squares.get(edge, 0) + value * value
+            
+            used = sampleSize
+            scale = vertexCount / (float(2) * used) if used else 0
+            
+            top = sorted(sums, key=sums.get, reverse=True)[:2]
+            bounds = [self.bound(sums[edge], squares[edge], used, vertexCount)
+                      for edge in top]
+            
+            if used >= limit or len(top) < 2:
+                break
+            
+            #Stop once the top two edges can be told apart
+            if (sums[top[0]] - sums[top[1]]) * scale > bounds[0] + bounds[1]:
+                break
+            
+            sampleSize = min(2 * used, limit)
+        
+        self.sampleSize = used
+        self.errorBound = bounds[0] if bounds else 0
+        
+        #Clear the old values of the edges being reevaluated
+        for vertex in vertexes:
+            for toVertex in graph['edges'][vertex]:
+                edge = frozenset([vertex, toVertex])
+                if edge in edgeValues:
+                    edgeValues[edge] = 0
+                    self.estimates[edge] = (used, 0)
+        
+        for edge, value in sums.iteritems():
+            if edge in edgeValues:
+                edgeValues[edge] = value * scale
+                self.estimates[edge] = (used, self.bound(value, squares[edge],
+                                                         used, vertexCount))
+    
+    def bound(self, total, square, used, vertexCount):
+        '''Returns the error bound of an edge's estimate from the
+        sum and sum of squares of its per-source contributions'''
+        if used >= vertexCount or used < 2:
+            return 0
+        
+        mean = total / float(used)
+        variance = max(0, (square - used * mean * mean) / (used - 1))
+        
+        #Sampling without replacement from the vertexes
+        correction = (vertexCount - used) / float(vertexCount - 1)
+        
+        return (self.confidence * vertexCount / float(2)
+                * math.sqrt(variance / used * correction))
+    
+#-----------------------------------------------------------
+
+def enumeratedEdgeValues(vertexes, graph, edgeValues):
+    '''When given a set of vertices of a graph, this method
+    updates the values in edgeValues for edge-betweenness by
+    listing every shortest path between every pair of vertices.
+
+    This was the original implementation. It is exponential on
+    graphs with many shortest paths and is kept to cross-check
+    updateEdgeValues.
+    '''
     combinationGenerator = combinations(vertexes, 2)
     
     try:
@@ -181,12 +835,84 @@ updates the values in edgeValues for edge-betweenness.
             
 #-----------------------------------------------------------
 
+class EdgeValueHeap(dict):
+    '''A dictionary of edge values that can also find the edge
+    with the highest value in O(log E).
+
+    Every assignment pushes the new value onto a heap. Entries
+    whose edge has since been deleted or given another value are
+    skipped when they reach the top, and the heap is rebuilt
+    when stale entries outnumber the edges. Values within
+    TIE_TOLERANCE of the highest count as ties, which are broken
+    by the sorted vertices of the edges, so rounding in the order
+    the values were summed in, as differs between the serial and
+    parallel betweenness, does not change the edge chosen.
+
+    USES: heapq
+    '''
+    
+    def __init__(self):
+        dict.__init__(self)
+        self.heap = list()
+    
+    def __setitem__(self, edge, value):
+        dict.__setitem__(self, edge, value)
+        heapq.heappush(self.heap, (-value, tuple(sorted(edge)), edge))
+        
+        if len(self.heap) > 2 * len(self) + 64:
+            self.rebuild()
+    
+    def rebuild(self):
+        '''Drops the stale entries from the heap'''
+        self.heap = [(-value, tuple(sorted(edge)), edge)
+                     for edge, value in self.iteritems()]
+        heapq.heapify(self.heap)
+    
+    def mostTraversed(self):
+        '''Returns the edge with the highest value'''
+        heap = self.heap
+        ties = list()
+        
+        while heap:
+            value, order, edge = heap[0]
+            if not (edge in self and dict.__getitem__(self, edge) == -value):
+                heapq.heappop(heap)
+            elif ties and not isTie(-ties[0][0], -value):
+                break
+            else:
+                ties.append(heapq.heappop(heap))
+        
+        if not ties:
+            raise KeyError('mostTraversed(): no edges')
+        
+        for entry in ties:
+            heapq.heappush(heap, entry)
+            
+        return min(ties, key=operator.itemgetter(1))[2]
+
+def isTie(highest, value):
+    '''Returns whether value is within TIE_TOLERANCE of the
+    highest value, relative to its size'''
+    return highest - value <= TIE_TOLERANCE * max(1, abs(highest))
+
+#-----------------------------------------------------------
+
 def removeMostTraversedEdge(graph, edgeValues):
-'''Given a graph and all the edge weights of that graph,
-it removes the edge with the highest betweenness value.
-'''
-mostUsed = max(edgeValues.iteritems(), key=operator.itemgetter(1))[0]
-mostUsedList = list(mostUsed)
+    '''Given a graph and all the edge weights of that graph,
+    it removes the edge with the highest betweenness value.
+    An EdgeValueHeap finds the edge in O(log E), while any other
+    dictionary is scanned.
+    '''
+    if isinstance(edgeValues, EdgeValueHeap):
+        mostUsed = edgeValues.mostTraversed()
+    else:
+        highest = max(edgeValues.itervalues())
+        mostUsed = min((edge for edge, value in edgeValues.iteritems()
+                        if isTie(highest, value)),
+                       key=lambda edge: tuple(sorted(edge)))
+    #Sorted, as the order of a frozenset can change when it is
+    #unpickled from a checkpoint
+    mostUsedList = sorted(mostUsed)
 
     #print 'Removing edge', mostUsed
     removeUndirectedEdge(graph, mostUsedList[0], mostUsedList[1])
@@ -198,18 +924,18 @@ mostUsedList = list(mostUsed)
 #-----------------------------------------------------------
 
 def densityModularity(graph, basegraph):
-'''
-DEPRECATED
-If given an undirected graph, it computes the modularity
-of the graph by first, computing all the clusters of the
-graph. For each cluster, it counts the number of
-internal edges twice, then divides it by the number of
-vertexes, thus resembling the average inner edge count
-per vertex. The final modularity is given by summing
-over the modularities of the clusters.
-
-NOTE: This was a custom made modularity and did not work well
-'''
+    '''
+    DEPRECATED
+    If given an undirected graph, it computes the modularity
+    of the graph by first, computing all the clusters of the
+    graph. For each cluster, it counts the number of
+    internal edges twice, then divides it by the number of
+    vertexes, thus resembling the average inner edge count
+    per vertex. The final modularity is given by summing
+    over the modularities of the clusters.
+
+    NOTE: This was a custom made modularity and did not work well
+    '''
     clusters = disconnectedComponents(graph)
     
     modularity = 0
@@ -230,92 +956,158 @@ NOTE: This was a custom made modularity and did not work well
 #-----------------------------------------------------------
 
 def removeUndirectedEdge(graph, a, b):
-'''If given an undirected graph, it removes the connections
-between the vertexes a and b. If the edge does not
-exist or is directed, then a KeyError will be thrown.
-'''
+    '''If given an undirected graph, it removes the connections
+    between the vertexes a and b. If the edge does not
+    exist or is directed, then a KeyError will be thrown.
+    '''
     graph['edges'][a].remove(b)
     graph['edges'][b].remove(a)
 
 #-----------------------------------------------------------
 
-def allShortestPaths(graph, start, end):
-'''If given a graph that is undirected and a path exists 
-between the start and end vertexes, this method is 
-guaranteed to return a list containing all the
-shortest paths.
+class ShortestPathDag:
+    '''The shortest paths from a start vertex of an undirected
+    graph, kept as a directed acyclic graph instead of a list of
+    paths. For each vertex reached it stores
 
-graph - undirected graph
-start - vertex to start the search from
-end - vertex to finish at
+    distance[v]      the length of the shortest paths to v
+    pathCount[v]     the number of shortest paths to v
+    predecessors[v]  the neighbours of v one step closer to start
 
-Returns a list of all shortest paths from start to end.
-'''
+    and 'order' lists the vertices in the order they were
+    reached. It takes O(V + E) space however many shortest paths
+    there are. The paths themselves can be iterated lazily with
+    paths, and edgeShares gives the fraction of the paths to a
+    vertex that use each edge.
 
-    #print 'Shortest paths from {0} to {1}'.format(start,end)
-    explored = set()
-    distance = dict()
-    queue = deque()
+    USES: deque
+    '''
     
-    #Place default values in dictionary
-    for vertex in graph['vertexes']:
-        distance[vertex] = -2    
-
-    explored.add(start)
-    queue.append(start)
-    distance[start] = 0
-    
-    #BFS to label distances to vertices up to the end vertex
-    while queue:
-        vertex = queue.popleft()
+    def __init__(self, graph, start, end=None):
+        '''Runs a breadth first search from start. If end is given,
+        the search stops once the paths to end are complete.'''
+        self.start = start
+        self.distance = dict()
+        self.pathCount = dict()
+        self.predecessors = dict()
+        self.order = list()
         
-        if vertex == end:
-            break
-            
-        for toVertex in graph['edges'][vertex]:
+        queue = deque()
+        
+        self.distance[start] = 0
+        self.pathCount[start] = 1
+        self.predecessors[start] = list()
+        queue.append(start)
+        
+        while queue:
+            vertex = queue.popleft()
+            self.order.append(vertex)
             
-            if toVertex not in explored:
-                explored.add(toVertex)
-                distance[toVertex] = distance[vertex] + 1
-                queue.append(toVertex)
-
-    #print 'DISTANCES', distance
+            if vertex == end:
+                break
             
-    #Reverse BFS on labeled vertices to build all paths    
-    pathQueue = deque()
-    pathQueue.append([end])
-    shortestPaths = list()
+            for toVertex in graph['edges'][vertex]:
+                if toVertex not in self.distance:
+                    self.distance[toVertex] = self.distance[vertex] + 1
+                    self.pathCount[toVertex] = 0
+                    self.predecessors[toVertex] = list()
+                    queue.append(toVertex)
+                    
+                if self.distance[toVertex] == self.distance[vertex] + 1:
+                    self.pathCount[toVertex] += self.pathCount[vertex]
+                    self.predecessors[toVertex].append(vertex)
+    
+    def count(self, end):
+        '''Returns the number of shortest paths from start to end'''
+        return self.pathCount.get(end, 0)
     
-    while pathQueue:
-        #print '\tQUEUE', pathQueue
-        path = pathQueue.popleft()
+    def paths(self, end):
+        '''Iterates over the shortest paths from start to end, each
+        as a list of vertices, building one path at a time'''
+        if end not in self.distance:
+            return
+            
+        if end == self.start:
+            yield [end]
+            return
         
-        vertex = path[0]
-        #print 'CHECKING PATH', path
-        for toVertex in graph['edges'][vertex]:
+        #path[k] is the vertex whose predecessors stack[k] iterates
+        path = [end]
+        stack = [iter(self.predecessors[end])]
+        
+        while stack:
+            try:
+                fromVertex = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                path.pop()
+                continue
             
-            if distance[toVertex] == (distance[vertex] - 1):
-                
-                #print '\tAPPENDING ELEMENT', toVertex
-                newpath = list(path)
-                newpath.insert(0, toVertex)
-                
-                if toVertex == start:
-                    shortestPaths.append(newpath)
-                else:
-                    pathQueue.append(newpath)
-                
-                
-    return shortestPaths
+            if fromVertex == self.start:
+                yield [fromVertex] + path[::-1]
+            else:
+                path.append(fromVertex)
+                stack.append(iter(self.predecessors[fromVertex]))
+    
+    def edgeShares(self, end):
+        '''Returns a dictionary from each edge on a shortest path
+        from start to end to the fraction of those paths using it'''
+        shares = dict()
+        
+        if end not in self.distance or end == self.start:
+            return shares
+        
+        #Number of shortest paths from each vertex on to end
+        pathsToEnd = {end: 1}
+        total = float(self.pathCount[end])
+        
+        #Work back one distance at a time, so each vertex's count
+        #is complete before it is passed on
+        level = [end]
+        while level:
+            nextLevel = list()
+            for vertex in level:
+                for fromVertex in self.predecessors[vertex]:
+                    if fromVertex not in pathsToEnd:
+                        pathsToEnd[fromVertex] = 0
+                        nextLevel.append(fromVertex)
+                    pathsToEnd[fromVertex] += pathsToEnd[vertex]
+                    
+                    edge = frozenset([fromVertex, vertex])
+                    shares[edge] = self.pathCount[fromVertex] * pathsToEnd[vertex] / total
+            level = nextLevel
+        
+        return shares
+
+#-----------------------------------------------------------
+
+def allShortestPaths(graph, start, end):
+    '''If given a graph that is undirected and a path exists 
+    between the start and end vertexes, this method is 
+    guaranteed to return a list containing all the
+    shortest paths.
+
+    graph - undirected graph
+    start - vertex to start the search from
+    end - vertex to finish at
+
+    Returns a list of all shortest paths from start to end. The
+    number of paths can grow exponentially, so callers that only
+    need counts or edge shares should use ShortestPathDag.
+    '''
+    if start == end:
+        return list()
+        
+    return list(ShortestPathDag(graph, start, end).paths(end))
 #-----------------------------------------------------------
 
 def badModularity(graph, clusters):
-'''DEPRECATED
+	'''DEPRECATED
 
-As discussed in the paper, this modularity will not provide
-good clusters and is included to help my check my own
-calculations with the modularity.
-'''
+	As discussed in the paper, this modularity will not provide
+	good clusters and is included to help my check my own
+	calculations with the modularity.
+	'''
 	modularity = 0
 	for cluster in clusters:
 		print 'Examaning cluster', clusters
@@ -332,9 +1124,9 @@ calculations with the modularity.
 	return modularity
 
 def generateFigure():
-'''Creates a graph as described in the graph module that 
-creates the full graph of the figure in the paper that
-shows the need for a modularity.'''
+	'''Creates a graph as described in the graph module that 
+	creates the full graph of the figure in the paper that
+	shows the need for a modularity.'''
 	graph = dict()
 	graph['vertexes'] = set(range(10))
 	graph['edges'] = dict()
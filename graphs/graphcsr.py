@@ -0,0 +1,259 @@
+'''module graphcsr
+This module contains a compact graph that stores its edges in
+compressed sparse row (CSR) form instead of the dictionary of
+sets described in the graph module.
+
+Each vertex ID is mapped to a dense index 0..V-1. The
+neighbours of vertex i are the entries
+
+   neighbours[offsets[i]:offsets[i + 1]]
+
+sorted by index, and 'edgeIds' holds, for each of those
+entries, the id 0..E-1 of the undirected edge it belongs to,
+so edge values can be kept in flat arrays. Removed entries are
+only marked in 'alive', which lets copies share the arrays.
+
+A CSRGraph can be indexed like the dictionary graphs, so
+graph['vertexes'] and graph['edges'][v] give views that iterate
+over the original IDs. The methods of the graph, graphcluster
+and graphparse modules can therefore run on it without first
+converting it.
+
+USES: array, bisect, copy
+'''
+
+from array import array
+from bisect import bisect_left
+import copy
+
+#-----------------------------------------------------------
+
+class CSRGraph:
+    '''A graph stored as arrays of dense vertex indexes.
+    Use fromDict to build one from a graph in the dictionary
+    format.
+    '''
+
+    def __init__(self, ids, offsets, neighbours, edgeIds, edgeCount):
+        '''Wraps already built CSR arrays. 'ids' lists the original
+        ID of each dense index.'''
+        self.ids = ids
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.edgeIds = edgeIds
+        self.edgeCount = edgeCount
+
+    def __getattr__(self, name):
+        '''Builds the ID lookup, the removal marks and the degrees
+        the first time they are used, so a graph over mapped
+        arrays can be opened without reading them'''
+        if name == 'index':
+            self.index = dict((vertex, i) for i, vertex in enumerate(self.ids))
+        elif name == 'alive':
+            self.alive = bytearray('\x01') * len(self.neighbours)
+        elif name == 'degrees':
+            offsets = self.offsets
+            self.degrees = array('l', (offsets[i + 1] - offsets[i]
+                                       for i in xrange(len(self.ids))))
+        else:
+            raise AttributeError(name)
+
+        return self.__dict__[name]
+
+    def __getitem__(self, key):
+        '''Lets the graph be used like the dictionary format'''
+        if key == 'vertexes':
+            return VertexView(self)
+        elif key == 'edges':
+            return EdgeView(self)
+        raise KeyError(key)
+
+    def __deepcopy__(self, memo):
+        '''Copies only the removal marks and degrees. The ID table
+        and the CSR arrays are never modified, so they are shared.'''
+        result = copy.copy(self)
+        result.alive = bytearray(self.alive)
+        result.degrees = array('l', self.degrees)
+        return result
+
+    def vertexCount(self):
+        '''Returns the number of vertices'''
+        return len(self.ids)
+
+    def slot(self, i, j):
+        '''Returns the position of the entry for the edge from dense
+        index i to dense index j, or -1 if there is none'''
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        position = bisect_left(self.neighbours, j, start, end)
+
+        if position < end and self.neighbours[position] == j:
+            return position
+        return -1
+
+    def neighbourIndexes(self, i):
+        '''Iterates over the dense indexes of the neighbours of
+        dense index i'''
+        alive = self.alive
+        neighbours = self.neighbours
+        for position in xrange(self.offsets[i], self.offsets[i + 1]):
+            if alive[position]:
+                yield neighbours[position]
+
+    def edgeSlots(self, i):
+        '''Iterates over (neighbour index, edge id) pairs for the
+        edges at dense index i'''
+        alive = self.alive
+        for position in xrange(self.offsets[i], self.offsets[i + 1]):
+            if alive[position]:
+                yield self.neighbours[position], self.edgeIds[position]
+
+    def edgeId(self, a, b):
+        '''Returns the id of the edge between the vertices with IDs
+        a and b. A KeyError is raised if there is no such edge.'''
+        position = self.slot(self.index[a], self.index[b])
+
+        if position < 0 or not self.alive[position]:
+            raise KeyError((a, b))
+        return self.edgeIds[position]
+
+    def removeEntry(self, a, b):
+        '''Removes b from the neighbours of a, leaving the entry for
+        the other direction. A KeyError is raised if it is not
+        there, as with set.remove.'''
+        i = self.index[a]
+        position = self.slot(i, self.index[b])
+
+        if position < 0 or not self.alive[position]:
+            raise KeyError(b)
+
+        self.alive[position] = 0
+        self.degrees[i] -= 1
+
+#-----------------------------------------------------------
+
+class VertexView:
+    '''The set of vertex IDs of a CSRGraph'''
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __iter__(self):
+        return iter(self.graph.ids)
+
+    def __len__(self):
+        return len(self.graph.ids)
+
+    def __contains__(self, vertex):
+        return vertex in self.graph.index
+
+#-----------------------------------------------------------
+
+class EdgeView:
+    '''The mapping from each vertex ID to its neighbours'''
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, vertex):
+        return NeighbourView(self.graph, self.graph.index[vertex])
+
+    def __iter__(self):
+        return iter(self.graph.ids)
+
+    def __len__(self):
+        return len(self.graph.ids)
+
+    def __contains__(self, vertex):
+        return vertex in self.graph.index
+
+    def iteritems(self):
+        for vertex in self.graph.ids:
+            yield vertex, self[vertex]
+
+#-----------------------------------------------------------
+
+class NeighbourView:
+    '''The set of neighbour IDs of one vertex of a CSRGraph'''
+
+    def __init__(self, graph, i):
+        self.graph = graph
+        self.i = i
+
+    def __iter__(self):
+        ids = self.graph.ids
+        for j in self.graph.neighbourIndexes(self.i):
+            yield ids[j]
+
+    def __len__(self):
+        return self.graph.degrees[self.i]
+
+    def __contains__(self, vertex):
+        j = self.graph.index.get(vertex)
+        if j is None:
+            return False
+
+        position = self.graph.slot(self.i, j)
+        return position >= 0 and bool(self.graph.alive[position])
+
+    def remove(self, vertex):
+        self.graph.removeEntry(self.graph.ids[self.i], vertex)
+
+#-----------------------------------------------------------
+
+def fromDict(graph):
+    '''Builds a CSRGraph from a graph in the dictionary format.
+    The vertices keep the iteration order of graph['vertexes'].
+    '''
+    ids = list(graph['vertexes'])
+    index = dict((vertex, i) for i, vertex in enumerate(ids))
+
+    offsets = array('l', [0])
+    neighbours = array('l')
+
+    for vertex in ids:
+        row = sorted(index[toVertex] for toVertex in graph['edges'][vertex]
+                     if toVertex in index)
+        neighbours.extend(row)
+        offsets.append(len(neighbours))
+
+    return fromArrays(ids, offsets, neighbours)
+
+def fromArrays(ids, offsets, neighbours):
+    '''Builds a CSRGraph from the IDs of the vertices and their
+    sorted neighbour rows, giving each undirected edge an id.
+    '''
+    #Give both entries of an undirected edge the same id
+    edgeIds = array('l', [-1]) * len(neighbours)
+    edgeCount = 0
+
+    for i in xrange(len(ids)):
+        for position in xrange(offsets[i], offsets[i + 1]):
+            if edgeIds[position] >= 0:
+                continue
+
+            edgeIds[position] = edgeCount
+            j = neighbours[position]
+
+            if j != i:
+                start = offsets[j]
+                end = offsets[j + 1]
+                other = bisect_left(neighbours, i, start, end)
+                if other < end and neighbours[other] == i:
+                    edgeIds[other] = edgeCount
+
+            edgeCount += 1
+
+    return CSRGraph(ids, offsets, neighbours, edgeIds, edgeCount)
+
+def toDict(graph):
+    '''Converts a CSRGraph back into the dictionary format'''
+    result = dict()
+    result['vertexes'] = set(graph.ids)
+    result['edges'] = dict()
+
+    for i, vertex in enumerate(graph.ids):
+        result['edges'][vertex] = set(graph.ids[j]
+                                      for j in graph.neighbourIndexes(i))
+
+    return result
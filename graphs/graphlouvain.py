@@ -0,0 +1,144 @@
+'''module graphlouvain
+The methods in this module find clusters that maximize the
+modularity suggested by Newman and Girvan with the multilevel
+method of Blondel et al. (2008), often called Louvain.
+
+Each level moves single vertices to the neighbouring cluster
+that raises the modularity most, until no move helps, and then
+merges every cluster into one vertex of a smaller weighted
+graph for the next level. Each pass is linear in the number of
+edges, so this is much faster than edge-betweenness clustering
+on large graphs.
+
+USES: graphcluster
+'''
+
+from graphcluster import ModularityTracker
+
+#-----------------------------------------------------------
+
+def cluster(graph):
+    '''When given a graph, this method clusters it with the
+    multilevel method and returns a results list in the same
+    form as graphcluster.cluster, where
+
+    result[0] is the cluster that maximizes the modularity
+    result[1] is the number of clusters and modularity of each level
+    result[2] is the clustering of each level
+
+    The levels are ordered from the fewest clusters to the
+    most, ending with every vertex in its own cluster, as in
+    graphcluster.cluster.
+    '''
+    #Weighted adjacency of the current level. The weight from
+    #a vertex to itself counts the edge ends inside it.
+    adjacency = dict()
+    for vertex in graph['vertexes']:
+        adjacency[vertex] = dict((toVertex, 1) for toVertex in graph['edges'][vertex])
+
+    members = dict((vertex, set([vertex])) for vertex in graph['vertexes'])
+
+    levels = [members.values()]
+
+    while True:
+        community = moveVertexes(adjacency)
+
+        if len(set(community.itervalues())) == len(adjacency):
+            break
+
+        adjacency, members = aggregate(adjacency, members, community)
+        levels.append(members.values())
+
+    levels.reverse()
+
+    cutData = list()
+    bestClusters = levels[0]
+    bestModularity = None
+
+    for clusters in levels:
+        modularity = ModularityTracker(graph, clusters).modularity()
+        cutData.append([len(clusters), modularity])
+
+        if bestModularity is None or modularity > bestModularity:
+            bestModularity = modularity
+            bestClusters = clusters
+
+    return [bestClusters, cutData, levels]
+
+#-----------------------------------------------------------
+
+def moveVertexes(adjacency):
+    '''Moves each vertex of the weighted graph to the
+    neighbouring community with the largest gain in modularity
+    until no vertex moves. Returns the community of each vertex.
+    '''
+    degree = dict()
+    for vertex, edges in adjacency.iteritems():
+        degree[vertex] = sum(edges.itervalues())
+
+    edgeEnds = float(sum(degree.itervalues()))
+    if edgeEnds == 0:
+        return dict((vertex, vertex) for vertex in adjacency)
+
+    community = dict((vertex, vertex) for vertex in adjacency)
+    total = dict(degree)
+    order = sorted(adjacency)
+
+    moved = True
+    while moved:
+        moved = False
+
+        for vertex in order:
+            current = community[vertex]
+            vertexDegree = degree[vertex]
+
+            #Weight from the vertex to each neighbouring community
+            links = dict()
+            for toVertex, weight in adjacency[vertex].iteritems():
+                if toVertex != vertex:
+                    label = community[toVertex]
+                    links[label] = links.get(label, 0) + weight
+
+            total[current] -= vertexDegree
+
+            best = current
+            bestGain = links.get(current, 0) - total[current] * vertexDegree / edgeEnds
+
+            for label in sorted(links):
+                gain = links[label] - total[label] * vertexDegree / edgeEnds
+                if gain > bestGain:
+                    best = label
+                    bestGain = gain
+
+            total[best] += vertexDegree
+            community[vertex] = best
+
+            if best != current:
+                moved = True
+
+    return community
+
+#-----------------------------------------------------------
+
+def aggregate(adjacency, members, community):
+    '''Merges the vertices of each community into a single
+    vertex. Returns the new weighted adjacency and the original
+    vertices that each new vertex contains.
+    '''
+    labels = dict()
+    for label in sorted(set(community.itervalues())):
+        labels[label] = len(labels)
+
+    newAdjacency = dict((label, dict()) for label in labels.itervalues())
+    newMembers = dict((label, set()) for label in labels.itervalues())
+
+    for vertex, edges in adjacency.iteritems():
+        label = labels[community[vertex]]
+        newMembers[label] |= members[vertex]
+
+        row = newAdjacency[label]
+        for toVertex, weight in edges.iteritems():
+            toLabel = labels[community[toVertex]]
+            row[toLabel] = row.get(toLabel, 0) + weight
+
+    return newAdjacency, newMembers
@@ -0,0 +1,124 @@
+'''module graphmodularity
+This module computes the modularity suggested by Newman and
+Girvan with NumPy instead of nested Python loops.
+
+The edges of the base graph are kept as two arrays holding the
+dense index of each end. A clustering becomes the sparse
+vertex-to-cluster membership matrix M, stored in compressed
+form as the cluster label of each vertex, so the whole matrix
+e = M'AM / 2m of graphcluster.suggestedModularity is a single
+bincount over the labels of the edge ends.
+
+USES: numpy, graphcsr
+'''
+
+import numpy
+from graphcsr import CSRGraph, fromDict
+
+#-----------------------------------------------------------
+
+class ModularityEvaluator:
+    '''Scores clusterings of one base graph. An instance is
+    called like graphcluster.suggestedModularity, so it can be
+    given as the modularity of graphcluster.cluster, and batch
+    scores many clusterings, such as the levels of a hierarchy,
+    in one call.
+    '''
+
+    def __init__(self, basegraph):
+        '''Builds the edge arrays of the base graph'''
+        if isinstance(basegraph, CSRGraph):
+            csr = basegraph
+        else:
+            csr = fromDict(basegraph)
+
+        self.basegraph = basegraph
+        self.ids = list(csr.ids)
+        self.index = dict((vertex, i) for i, vertex in enumerate(self.ids))
+
+        offsets = numpy.array(csr.offsets, dtype=numpy.int64)
+        neighbours = numpy.array(csr.neighbours, dtype=numpy.int64)
+        alive = numpy.frombuffer(csr.alive, dtype=numpy.uint8).astype(bool)
+
+        sources = numpy.repeat(numpy.arange(len(self.ids)), numpy.diff(offsets))
+
+        self.sources = sources[alive]
+        self.targets = neighbours[alive]
+        self.edgeEnds = len(self.sources)
+
+    def labels(self, clusters):
+        '''Returns the cluster label of each vertex. Vertices that
+        are in none of the clusters get the label len(clusters).'''
+        labels = numpy.empty(len(self.ids), dtype=numpy.int64)
+        labels.fill(len(clusters))
+
+        for label, cluster in enumerate(clusters):
+            members = numpy.fromiter((self.index[vertex] for vertex in cluster),
+                                     dtype=numpy.int64, count=len(cluster))
+            labels[members] = label
+
+        return labels
+
+    def matrix(self, clusters):
+        '''Returns the matrix e of suggestedModularity, where e[i][j]
+        is the fraction of edge ends from cluster i to cluster j. It
+        is dense, so it takes O(k^2) memory for k clusters.'''
+        size = len(clusters) + 1
+        labels = self.labels(clusters)
+
+        counts = numpy.bincount(labels[self.sources] * size + labels[self.targets],
+                                minlength=size * size)
+
+        e = counts.reshape(size, size)[:-1, :-1]
+        return e / float(self.edgeEnds)
+
+    def __call__(self, clusters, basegraph=None):
+        '''Returns the modularity of the clusters. The base graph the
+        evaluator was built for is always used. Only the trace and
+        the row sums of e are counted, so this takes O(V + E) memory
+        however many clusters there are.'''
+        if self.edgeEnds == 0 or not clusters:
+            return 0
+
+        labels = self.labels(clusters)
+        sourceLabels = labels[self.sources]
+        targetLabels = labels[self.targets]
+
+        clustered = targetLabels != len(clusters)
+
+        internal = ((sourceLabels == targetLabels) & clustered).sum()
+        degrees = numpy.bincount(sourceLabels[clustered], minlength=len(clusters))
+
+        edgeEnds = float(self.edgeEnds)
+        return float(internal / edgeEnds
+                     - numpy.square(degrees[:len(clusters)] / edgeEnds).sum())
+
+    def batch(self, clusterings):
+        '''Returns an array with the modularity of each of the
+        clusterings, computed together'''
+        if not clusterings:
+            return numpy.zeros(0)
+        if self.edgeEnds == 0:
+            return numpy.zeros(len(clusterings))
+
+        #Give each clustering its own range of labels so that a
+        #single bincount covers all of them
+        size = max(len(clusters) for clusters in clusterings) + 1
+        labels = numpy.vstack([self.labels(clusters) for clusters in clusterings])
+
+        unclustered = labels == numpy.array([len(clusters) for clusters in clusterings])[:, None]
+        labels[unclustered] = size - 1
+        labels += (numpy.arange(len(clusterings)) * size)[:, None]
+
+        sourceLabels = labels[:, self.sources]
+        targetLabels = labels[:, self.targets]
+
+        internal = ((sourceLabels == targetLabels)
+                    & (sourceLabels % size != size - 1)).sum(axis=1)
+
+        degrees = numpy.bincount(sourceLabels[targetLabels % size != size - 1].ravel(),
+                                 minlength=size * len(clusterings))
+        degrees = degrees.reshape(len(clusterings), size)[:, :-1]
+
+        edgeEnds = float(self.edgeEnds)
+        return internal / edgeEnds - numpy.square(degrees / edgeEnds).sum(axis=1)
@@ -0,0 +1,120 @@
+'''module graphobserve
+This module contains observers for graphcluster.cluster. An
+observer is any callable given in the observers list of
+cluster, and it is called with a graphcluster.ClusterEvent
+after each edge is removed. For example
+
+   counters = Counters()
+   with open('timing.csv', 'w') as f:
+      cluster(grph, observers=[ProgressBar(), TimingLog(f), counters])
+   print counters.report()
+
+shows the progress of the run, logs the time of each phase of
+each iteration, and then prints where the time went.
+
+USES: csv, sys
+'''
+
+import csv
+import sys
+
+PHASES = ['removal', 'components', 'modularity', 'betweenness']
+
+#-----------------------------------------------------------
+
+class ProgressBar:
+    '''Draws the fraction of edges removed so far, the number of
+    components and the modularity on one line of out, which is
+    sys.stderr by default'''
+
+    def __init__(self, out=None, width=40):
+        if out is None:
+            out = sys.stderr
+
+        self.out = out
+        self.width = width
+        self.drawn = -1
+
+    def __call__(self, event):
+        done = event.iteration + 1
+        filled = self.width * done // event.total
+
+        #Only redraw when the bar grows or the run ends
+        if filled == self.drawn and done != event.total:
+            return
+        self.drawn = filled
+
+        self.out.write('\r[{0}{1}] {2}/{3} edges, {4} components, Q={5:.4f}'.format(
+            '#' * filled, ' ' * (self.width - filled), done, event.total,
+            event.components, event.modularity))
+
+        if done == event.total:
+            self.out.write('\n')
+        self.out.flush()
+
+#-----------------------------------------------------------
+
+class TimingLog:
+    '''Writes a CSV row for each iteration to the open file out,
+    with the removed edge, the number of components, the
+    modularity and the seconds spent in each phase'''
+
+    def __init__(self, out):
+        self.writer = csv.writer(out)
+        self.started = False
+
+    def __call__(self, event):
+        if not self.started:
+            self.writer.writerow(['iteration', 'fromVertex', 'toVertex',
+                                  'components', 'modularity'] + PHASES)
+            self.started = True
+
+        self.writer.writerow([event.iteration, event.edge[0], event.edge[1],
+                              event.components, repr(event.modularity)]
+                             + [repr(event.times[phase]) for phase in PHASES])
+
+#-----------------------------------------------------------
+
+class Counters:
+    '''Sums the number of iterations, the number of splits and
+    the time of each phase over a run'''
+
+    def __init__(self):
+        self.iterations = 0
+        self.splits = 0
+        self.times = dict.fromkeys(PHASES, 0.0)
+
+        self.components = None
+        self.bestModularity = None
+
+    def __call__(self, event):
+        self.iterations += 1
+
+        #Compare the first event with the count before the run
+        if self.components is None:
+            self.components = event.startComponents
+
+        if event.components > self.components:
+            self.splits += event.components - self.components
+        self.components = event.components
+
+        if self.bestModularity is None or event.modularity > self.bestModularity:
+            self.bestModularity = event.modularity
+
+        for phase in PHASES:
+            self.times[phase] += event.times[phase]
+
+    def report(self):
+        '''Returns the totals as lines of text, with the share of
+        the time taken by each phase'''
+        total = sum(self.times.itervalues())
+
+        lines = ['{0} iterations, {1} splits, best Q={2}'.format(
+            self.iterations, self.splits, self.bestModularity)]
+
+        for phase in PHASES:
+            share = self.times[phase] / total if total else 0
+            lines.append('{0:>12} {1:10.4f}s {2:6.1%}'.format(
+                phase, self.times[phase], share))
+
+        return '\n'.join(lines)
@@ -0,0 +1,177 @@
+'''module graphparallel
+This module computes edge-betweenness on several cores. The
+contribution of each source vertex is independent of the
+others, so the sources are split into chunks, each worker
+process accumulates the edge values of its chunk, and the
+partial values are summed.
+
+The workers read the adjacency of the graph in CSR form (see
+the graphcsr module) from shared memory, so the graph is not
+copied to every process. Only the marks of removed edges and
+of the vertices being reevaluated change between calls.
+
+USES: graphcsr, multiprocessing, collections
+'''
+
+from graphcsr import CSRGraph, fromDict
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
+from collections import deque
+
+#Shared arrays, set in each worker by initializeWorker
+shared = dict()
+
+#-----------------------------------------------------------
+
+class ParallelBetweenness:
+    '''Computes edge-betweenness with a pool of worker processes.
+    An instance can be given as the betweenness of the
+    graphcluster.cluster method, as it is called like
+    graphcluster.updateEdgeValues. Call close when done.
+    '''
+
+    def __init__(self, graph, workers, chunksPerWorker=4):
+        '''Copies the adjacency of graph into shared memory and
+        starts the worker processes'''
+        if isinstance(graph, CSRGraph):
+            csr = graph
+        else:
+            csr = fromDict(graph)
+
+        self.csr = csr
+        self.workers = workers
+        self.chunksPerWorker = chunksPerWorker
+
+        self.offsets = RawArray('l', csr.offsets)
+        self.neighbours = RawArray('l', csr.neighbours)
+        self.edgeIds = RawArray('l', csr.edgeIds)
+        self.alive = RawArray('b', len(csr.neighbours))
+        self.targets = RawArray('b', csr.vertexCount())
+
+        #Endpoints of each edge id, to map values back to edges
+        self.endpoints = [None] * csr.edgeCount
+        for i in xrange(csr.vertexCount()):
+            for position in xrange(csr.offsets[i], csr.offsets[i + 1]):
+                self.endpoints[csr.edgeIds[position]] = (i, csr.neighbours[position])
+
+        self.pool = Pool(workers, initializeWorker,
+                         (self.offsets, self.neighbours, self.edgeIds,
+                          self.alive, self.targets))
+
+    def __call__(self, vertexes, graph, edgeValues):
+        '''Updates the values in edgeValues for edge-betweenness of
+        the given vertices of graph, which must have the vertices
+        of the graph the pool was started with'''
+        csr = self.csr
+        sources = sorted(csr.index[vertex] for vertex in set(vertexes))
+
+        #Copy the current edges of the vertexes into shared memory
+        for i in sources:
+            vertex = csr.ids[i]
+            edges = graph['edges'][vertex]
+            for position in xrange(csr.offsets[i], csr.offsets[i + 1]):
+                self.alive[position] = csr.ids[csr.neighbours[position]] in edges
+            self.targets[i] = 1
+
+        chunkCount = max(1, self.workers * self.chunksPerWorker)
+        chunkSize = max(1, -(-len(sources) // chunkCount))
+        chunks = [sources[start:start + chunkSize]
+                  for start in xrange(0, len(sources), chunkSize)]
+
+        #Reduce in chunk order so runs are reproducible
+        values = dict()
+        for partial in self.pool.map(sourceEdgeValues, chunks):
+            for edgeId, value in partial.iteritems():
+                values[edgeId] = values.get(edgeId, 0) + value
+
+        for i in sources:
+            self.targets[i] = 0
+
+        #Clear the old values of the edges being reevaluated
+        for i in sources:
+            vertex = csr.ids[i]
+            for toVertex in graph['edges'][vertex]:
+                edge = frozenset([vertex, toVertex])
+                if edge in edgeValues:
+                    edgeValues[edge] = 0
+
+        for edgeId, value in values.iteritems():
+            i, j = self.endpoints[edgeId]
+            edge = frozenset([csr.ids[i], csr.ids[j]])
+            if edge in edgeValues:
+                edgeValues[edge] = value / float(2)
+
+    def close(self):
+        '''Stops the worker processes'''
+        self.pool.close()
+        self.pool.join()
+
+#-----------------------------------------------------------
+
+def initializeWorker(offsets, neighbours, edgeIds, alive, targets):
+    '''Stores the shared arrays in a worker process'''
+    shared['offsets'] = offsets
+    shared['neighbours'] = neighbours
+    shared['edgeIds'] = edgeIds
+    shared['alive'] = alive
+    shared['targets'] = targets
+
+def sourceEdgeValues(sources):
+    '''Returns a dictionary from edge id to the summed share of
+    the edge in the shortest paths from each of the sources to
+    the marked target vertices. Runs in a worker process.
+
+    USES: deque
+    '''
+    offsets = shared['offsets']
+    neighbours = shared['neighbours']
+    edgeIds = shared['edgeIds']
+    alive = shared['alive']
+    targets = shared['targets']
+
+    values = dict()
+
+    for start in sources:
+        distance = {start: 0}
+        pathCount = {start: 1}
+        order = list()
+        queue = deque([start])
+
+        #BFS counting the shortest paths to each vertex
+        while queue:
+            vertex = queue.popleft()
+            order.append(vertex)
+
+            for position in xrange(offsets[vertex], offsets[vertex + 1]):
+                if not alive[position]:
+                    continue
+
+                toVertex = neighbours[position]
+                if toVertex not in distance:
+                    distance[toVertex] = distance[vertex] + 1
+                    pathCount[toVertex] = 0
+                    queue.append(toVertex)
+
+                if distance[toVertex] == distance[vertex] + 1:
+                    pathCount[toVertex] += pathCount[vertex]
+
+        #Pass each vertex's dependency on to its predecessors
+        dependency = dict.fromkeys(order, 0)
+
+        for vertex in reversed(order):
+            credit = dependency[vertex]
+            if targets[vertex] and vertex != start:
+                credit += 1
+
+            for position in xrange(offsets[vertex], offsets[vertex + 1]):
+                if not alive[position]:
+                    continue
+
+                fromVertex = neighbours[position]
+                if distance[fromVertex] == distance[vertex] - 1:
+                    share = credit * pathCount[fromVertex] / float(pathCount[vertex])
+                    edgeId = edgeIds[position]
+                    values[edgeId] = values.get(edgeId, 0) + share
+                    dependency[fromVertex] += share
+
+    return values
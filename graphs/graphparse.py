@@ -7,6 +7,11 @@ files for the GAE are contained as well
 
 import json
 import csv
+import time
+import tempfile
+from array import array
+from itertools import izip
+import graphcsr
 
 def prepareUpload(graph, clusters, filepath):
     '''Given a graph and the clusters, this file output the JSON
@@ -14,78 +19,104 @@ def prepareUpload(graph, clusters, filepath):
     recommendations. The output file will be saved in the folder
     designated by "filepath"
 
+    The cluster of each vertex is looked up in an index built
+    once, and the JSON is written one vertex at a time so memory
+    does not grow with the number of vertices.
+
     USES: json
     '''
+    #Index of the first cluster that holds each vertex
+    clusterOf = dict()
+    for i in xrange(len(clusters) - 1, -1, -1):
+        for vertex in clusters[i]:
+            clusterOf[vertex] = i
     
-    data = dict()
-    
-    #Prepare the preferences list
-    for vertex in graph['vertexes']:
-        data[str(vertex)] = dict()
-        
-        #Clear to zero
-        prefs = [0] * len(clusters)
+    with open(filepath + 'uploadfile', 'w') as f:
+        f.write('{')
         
-        #For each vertex this is connected to
-        for edge in graph['edges'][vertex]:
-            #increment cluster friends for edge's cluster
-            for i in xrange(0,len(clusters)):
-                if edge in clusters[i]:
+        #Write the preferences list of each vertex
+        for vertex in graph['vertexes']:
+            
+            #Clear to zero
+            prefs = [0] * len(clusters)
+            
+            #increment cluster friends for each edge's cluster,
+            #and the cluster that vertex belongs to
+            friendCount = 0
+            for edge in graph['edges'][vertex]:
+                friendCount += 1
+                i = clusterOf.get(edge)
+                if i is not None:
                     prefs[i] += 1
-                    break
-                    
-        #increment cluster that vertex belongs to
-        for i in xrange(0, len(clusters)):
-            if vertex in clusters[i]:
-                prefs[i] += 1
-                break
             
-        #Divide each value by the number of friends
-        for i in xrange(0,len(clusters)):
-            prefs[i] /= float(len(graph['edges'][vertex]) + 1)
+            own = clusterOf.get(vertex)
+            if own is not None:
+                prefs[own] += 1
             
-        data[str(vertex)]['prefs'] = prefs
+            #Divide each value by the number of friends
+            friendCount = float(friendCount + 1)
+            prefs = [value / friendCount for value in prefs]
+            
+            entry = dict()
+            entry['prefs'] = prefs
+            if own is not None:
+                entry['cluster'] = own
+            
+            f.write(json.dumps(str(vertex)) + ': ' + json.dumps(entry) + ', ')
         
-    #Set which cluster each vertex belongs to
-    for i in xrange(0, len(clusters)):
-        for vertex in clusters[i]:
-            data[str(vertex)]['cluster'] = i
-    
-    with open(filepath + 'uploadfile', 'w') as f:
-    
-        data['clusters'] = list()
+        f.write('"clusters": [')
+        for i, cluster in enumerate(clusters):
+            if i:
+                f.write(', ')
+            f.write(json.dumps(list(cluster)))
+        f.write('], ')
         
-        for cluster in clusters:
-            data['clusters'].append(list(cluster))
+        #Pair each key with its value from the Octave solution
+        with open(filepath + 'key') as keyfile:
+            with open(filepath + 'solution.mat') as solutionfile:
+                pairs = [(float(value), key) for value, key in
+                         izip(readTokens(solutionfile), readTokens(keyfile))]
         
-        keys = list()
+        pairs.sort()
         
-        with open(filepath + 'key') as tmpfile:
-            keys = tmpfile.readline().split(' ')
-            
-        pairs = list()
-
-        with open(filepath + 'solution.mat') as tmpfile:
-            pairs = [float( value ) for value in tmpfile.readline().split(' ')]
-
-        result = sorted(zip(pairs, keys))
+        f.write('"markovorder": [')
         
-        sets = list()
         tmpset = set()
         previous = -1
+        written = 0
         
-        for pair in result:
+        for pair in pairs:
             tmpset.add(pair[1])
             if pair[0] > previous:
-                    sets.append(list(tmpset))
-                    tmpset = set()
+                f.write((', ' if written else '') + json.dumps(list(tmpset)))
+                written += 1
+                tmpset = set()
             previous = pair[0]
+        
+        f.write((', ' if written else '') + json.dumps(list(tmpset)))
+        f.write(']}')
 
-        sets.append(list(tmpset))
+def readTokens(f, blockSize=65536):
+    '''Yields the whitespace separated values of a file, reading
+    a block at a time instead of a whole line'''
+    partial = ''
+    
+    while True:
+        block = f.read(blockSize)
+        if not block:
+            break
+        
+        tokens = (partial + block).split()
+        partial = ''
         
-        data['markovorder'] = sets;
+        if tokens and not block[-1].isspace():
+            partial = tokens.pop()
         
-        json.dump(data, f)
+        for token in tokens:
+            yield token
+    
+    if partial:
+        yield partial
     
 def parse_csv(filepath):
     '''Attempts to parse the given filename from a CSV file
@@ -123,6 +154,157 @@ def parse_csv(filepath):
                 
     return grph
 
+def parse_csv_stream(filepath, chunkSize=1000000, spill=False, tmpdir=None):
+    '''Parses the same CSV files as parse_csv into a
+    graphcsr.CSRGraph without building a set of friends for
+    every vertex.
+
+    The IDs are interned to dense ints as the rows are read and
+    each friendship is kept as a pair of ints. Friends that never
+    get a row of their own are only dropped once the whole file
+    has been read, and the symmetric adjacency is then written
+    straight into the CSR arrays. If spill is True, the pairs are
+    written to temporary files in tmpdir every chunkSize pairs so
+    that only the ID table and the final arrays are held in
+    memory. The rows per second read are printed.
+
+    USES: csv, time, tempfile, array, itertools, graphcsr
+    '''
+    print 'Streaming CSV file:', filepath
+    
+    started = time.time()
+    
+    index = dict()
+    ids = list()
+    isVertex = bytearray()
+    
+    sources = array('l')
+    targets = array('l')
+    spills = list()
+    rows = 0
+    
+    with open(filepath, 'rb') as f:
+        for row in csv.reader(f):
+            if row[0] == 'idNum':
+                continue
+            
+            vertex = long(row[0])
+            i = index.get(vertex)
+            if i is None:
+                i = index[vertex] = len(ids)
+                ids.append(vertex)
+                isVertex.append(0)
+            
+            isVertex[i] = 1
+            
+            for friend in row[1].strip('[]"').split(','):
+                friend = friend.strip()
+                if not friend:
+                    continue
+                
+                friend = long(friend)
+                j = index.get(friend)
+                if j is None:
+                    j = index[friend] = len(ids)
+                    ids.append(friend)
+                    isVertex.append(0)
+                
+                sources.append(i)
+                targets.append(j)
+            
+            rows += 1
+            
+            if spill and len(sources) >= chunkSize:
+                spills.append(spillEdges(sources, targets, tmpdir))
+                sources = array('l')
+                targets = array('l')
+    
+    elapsed = max(time.time() - started, 1e-9)
+    print 'Read {0} rows in {1:.2f}s ({2:.0f} rows/s)'.format(rows, elapsed, rows / elapsed)
+    
+    del index
+    
+    #Only IDs that had a row of their own become vertices
+    remap = array('l', [-1]) * len(ids)
+    vertexIds = list()
+    for i in xrange(len(ids)):
+        if isVertex[i]:
+            remap[i] = len(vertexIds)
+            vertexIds.append(ids[i])
+    
+    del ids, isVertex
+    
+    #First pass counts the entries of each row
+    degrees = array('l', [0]) * len(vertexIds)
+    for chunkSources, chunkTargets in edgeChunks(spills, sources, targets):
+        for i, j in izip(chunkSources, chunkTargets):
+            i = remap[i]
+            j = remap[j]
+            if i < 0 or j < 0:
+                continue
+            
+            degrees[i] += 1
+            if i != j:
+                degrees[j] += 1
+    
+    offsets = array('l', [0])
+    for degree in degrees:
+        offsets.append(offsets[-1] + degree)
+    
+    #Second pass writes both directions of each edge
+    neighbours = array('l', [0]) * offsets[-1]
+    fill = array('l', offsets)
+    for chunkSources, chunkTargets in edgeChunks(spills, sources, targets):
+        for i, j in izip(chunkSources, chunkTargets):
+            i = remap[i]
+            j = remap[j]
+            if i < 0 or j < 0:
+                continue
+            
+            neighbours[fill[i]] = j
+            fill[i] += 1
+            if i != j:
+                neighbours[fill[j]] = i
+                fill[j] += 1
+    
+    del fill, sources, targets
+    for spilled in spills:
+        spilled[0].close()
+    
+    #Sort each row and drop the friendships listed from both ends
+    write = 0
+    for i in xrange(len(vertexIds)):
+        row = sorted(set(neighbours[offsets[i]:offsets[i + 1]]))
+        offsets[i] = write
+        neighbours[write:write + len(row)] = array('l', row)
+        write += len(row)
+    
+    offsets[len(vertexIds)] = write
+    del neighbours[write:]
+    
+    return graphcsr.fromArrays(vertexIds, offsets, neighbours)
+
+def spillEdges(sources, targets, tmpdir=None):
+    '''Writes the pairs to a temporary file for parse_csv_stream
+    and returns the file with the number of pairs in it'''
+    f = tempfile.TemporaryFile(dir=tmpdir)
+    sources.tofile(f)
+    targets.tofile(f)
+    return f, len(sources)
+
+def edgeChunks(spills, sources, targets):
+    '''Iterates over the spilled pairs of parse_csv_stream, one
+    file at a time, followed by the pairs still in memory'''
+    for f, count in spills:
+        f.seek(0)
+        chunkSources = array('l')
+        chunkTargets = array('l')
+        chunkSources.fromfile(f, count)
+        chunkTargets.fromfile(f, count)
+        yield chunkSources, chunkTargets
+    
+    yield sources, targets
+
 def parse_json(filepath):
     '''Attempts to parse the given filename from a JSON file
     into a graph described by the graph module. These files are
@@ -178,25 +360,60 @@ def storeResults(results, basedir):
     fileA.close()
     fileB.close()
     
-def toOctaveFile(graph, components,  filepath ):
+def toOctaveFile(graph, components,  filepath, mode='dense'):
     '''This method converts the graph with the given disconnected
     components into a format that the Markov Octave script can
     interpret to produce the ordering.
+
+    The adjacency matrix is written in one of the modes
+
+       'dense'    every 0/1 entry, one row per line, to "array",
+                  which the Markov Octave script loads
+       'triplet'  one "i j 1" line per edge, ending with "n n 0",
+                  to "array.triplet", which Octave reads with
+                  spconvert(load('array.triplet'))
+       'mtx'      a Matrix Market coordinate file "array.mtx"
+
+    The dense file grows with the square of the number of
+    vertices, so large graphs should be written in one of the
+    sparse modes and the script changed to read that file. Vertices
+    are numbered through an index map and rows are written in bulk.
     '''
     verts = list(graph['vertexes'])
     
     vertlen = len(verts)
     
-    array = [ [int(e in graph['edges'][v]) for e in verts]for v in verts]
+    index = dict((vert, i) for i, vert in enumerate(verts))
     
-    with open(filepath + 'array', 'w') as f:
-        for row in array:
-            for i in xrange(vertlen):
-                f.write(str(row[i]))
-                if not i == vertlen - 1:
-                    f.write(' ')
+    if mode == 'dense':
+        with open(filepath + 'array', 'w', 1 << 20) as f:
+            for v in verts:
+                row = ['0'] * vertlen
+                for e in graph['edges'][v]:
+                    if e in index:
+                        row[index[e]] = '1'
+                f.write(' '.join(row) + '\n')
+                
+    elif mode == 'triplet':
+        with open(filepath + 'array.triplet', 'w', 1 << 20) as f:
+            for i, v in enumerate(verts):
+                f.write(''.join('{0} {1} 1\n'.format(i + 1, index[e] + 1)
+                                for e in graph['edges'][v] if e in index))
+            
+            #Fixes the size of the matrix in spconvert
+            f.write('{0} {0} 0\n'.format(vertlen))
             
-            f.write('\n')
+    elif mode == 'mtx':
+        entries = sum(1 for v in verts for e in graph['edges'][v] if e in index)
+        
+        with open(filepath + 'array.mtx', 'w', 1 << 20) as f:
+            f.write('%%MatrixMarket matrix coordinate pattern general\n')
+            f.write('{0} {0} {1}\n'.format(vertlen, entries))
+            for i, v in enumerate(verts):
+                f.write(''.join('{0} {1}\n'.format(i + 1, index[e] + 1)
+                                for e in graph['edges'][v] if e in index))
+    else:
+        raise ValueError('Unknown Octave export mode: ' + str(mode))
             
     with open(filepath + 'trials', 'w') as f:
         for component in components:
@@ -206,7 +423,7 @@ def toOctaveFile(graph, components,  filepath ):
                 vert = item
                 break
                 
-            f.write(str(verts.index(vert) + 1) + ' ' + str(len(component)) + '\n')
+            f.write(str(index[vert] + 1) + ' ' + str(len(component)) + '\n')
     
     with open(filepath + 'key', 'w') as f:
         f.write(' '.join(str(vert) for vert in verts))
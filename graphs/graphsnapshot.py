@@ -0,0 +1,133 @@
+'''module graphsnapshot
+This module saves a graph to a binary snapshot that can be
+opened again without parsing, so repeated experiments do not
+have to read the CSV or JSON files each time.
+
+A snapshot is a header followed by four arrays of
+little-endian 64 bit integers:
+
+   header      'CSRGRAPH', version, vertex count, entry count
+               and edge count
+   ids         the original ID of each vertex
+   offsets     where each vertex's neighbours start
+   neighbours  the dense index of each neighbour
+   edgeIds     the undirected edge id of each entry
+
+which are the arrays of a graphcsr.CSRGraph. openSnapshot maps
+the file into memory and wraps the arrays without reading
+them, so it takes constant time, and the graph it returns can
+be clustered directly or converted with graphcsr.toDict.
+
+USES: graphcsr, array, struct, mmap, sys
+'''
+
+from graphcsr import CSRGraph, fromDict, fromArrays
+from array import array
+import struct
+import mmap
+import sys
+
+MAGIC = 'CSRGRAPH'
+VERSION = 1
+HEADER = struct.Struct('<8sIIqqq')
+
+#-----------------------------------------------------------
+
+class MappedArray:
+    '''A read only sequence of 64 bit integers stored in a
+    memory-mapped file'''
+
+    def __init__(self, mapping, offset, length):
+        self.mapping = mapping
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            if step != 1:
+                return [self[j] for j in xrange(start, stop, step)]
+            count = max(0, stop - start)
+            return list(struct.unpack_from('<%dq' % count, self.mapping,
+                                           self.offset + 8 * start))
+
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError('MappedArray index out of range')
+
+        return struct.unpack_from('<q', self.mapping, self.offset + 8 * i)[0]
+
+    def __iter__(self):
+        #Unpack a block at a time instead of one value at a time
+        block = 4096
+        for start in xrange(0, self.length, block):
+            for value in self[start:start + block]:
+                yield value
+
+#-----------------------------------------------------------
+
+def writeSnapshot(graph, filepath):
+    '''Writes the graph, either a CSRGraph or a graph in the
+    dictionary format, to a snapshot file. The vertex IDs must be
+    integers that fit in 64 bits.
+    '''
+    if not isinstance(graph, CSRGraph):
+        graph = fromDict(graph)
+
+    #Skip removed entries so the snapshot holds the current edges
+    offsets = array('l', [0])
+    neighbours = array('l')
+    for i in xrange(graph.vertexCount()):
+        neighbours.extend(graph.neighbourIndexes(i))
+        offsets.append(len(neighbours))
+
+    if len(neighbours) != len(graph.neighbours):
+        graph = fromArrays(graph.ids, offsets, neighbours)
+
+    with open(filepath, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(graph.ids),
+                            len(neighbours), graph.edgeCount))
+
+        for values in (graph.ids, offsets, neighbours, graph.edgeIds):
+            writeIntegers(f, values)
+
+def writeIntegers(f, values):
+    '''Writes the values as little-endian 64 bit integers'''
+    data = array('l', values)
+
+    if data.itemsize != 8:
+        f.write(struct.pack('<%dq' % len(data), *data))
+        return
+
+    if sys.byteorder == 'big':
+        data.byteswap()
+    data.tofile(f)
+
+#-----------------------------------------------------------
+
+def openSnapshot(filepath):
+    '''Maps a snapshot file into memory and returns it as a
+    CSRGraph. Nothing is read until the graph is used.
+    '''
+    with open(filepath, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, reserved, vertexCount, entryCount, edgeCount = \
+        HEADER.unpack_from(mapping, 0)
+
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a graph snapshot: ' + filepath)
+
+    offset = HEADER.size
+    sections = list()
+    for length in (vertexCount, vertexCount + 1, entryCount, entryCount):
+        sections.append(MappedArray(mapping, offset, length))
+        offset += 8 * length
+
+    ids, offsets, neighbours, edgeIds = sections
+
+    return CSRGraph(ids, offsets, neighbours, edgeIds, edgeCount)
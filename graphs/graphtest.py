@@ -5,12 +5,16 @@ methods were later deprecated."""
 
 import graph
 import graphcluster
+import graphlouvain
 import random
+import math
+import copy
+import os
 
 def create_test():
-'''Creates a graph as described in the graph module that
-represents Newman and Girvan's graph of the Karate Club.
-'''
+    '''Creates a graph as described in the graph module that
+    represents Newman and Girvan's graph of the Karate Club.
+    '''
     graph = dict()
     graph['vertexes'] = range(1,35)
     
@@ -53,15 +57,15 @@ represents Newman and Girvan's graph of the Karate Club.
     return graph
 
 def generatePlantedL(vertCount, clusters, p=float(1),q=float(0)):
-'''generatePlantedL( vertCount, clusters, p=1,q=0)
-Create a test graph that contains "vertCount" vertices, has
-"clusters" clusters, and the edges are placed where edges
-have a "p" probability of being between edges in the same
-cluster and a "q" probability of being between edges in
-different clusters.
-
-Uses: random
-'''
+    '''generatePlantedL( vertCount, clusters, p=1,q=0)
+    Create a test graph that contains "vertCount" vertices, has
+    "clusters" clusters, and the edges are placed where edges
+    have a "p" probability of being between edges in the same
+    cluster and a "q" probability of being between edges in
+    different clusters.
+
+    Uses: random
+    '''
     graph = dict()
     graph['vertexes'] = set(range(1, vertCount + 1))
     graph['edges'] = dict()
@@ -85,14 +89,87 @@ Uses: random
                     graph['edges'][j].add(i)
     
     return graph
+
+def generatePlanted(vertCount, clusters, p=float(1), q=float(0), seed=None):
+    '''generatePlanted( vertCount, clusters, p=1, q=0, seed=None)
+    Creates a graph with the same distribution as
+    generatePlantedL, vertex i + 1 being in cluster i % clusters,
+    but skips over the pairs without an edge instead of drawing a
+    random number for every pair, so it takes O(n + E) time. The
+    random numbers come from random.Random(seed).
+
+    Uses: random, math
+    '''
+    rand = random.Random(seed)
+    
+    graph = dict()
+    graph['vertexes'] = set(range(1, vertCount + 1))
+    graph['edges'] = dict()
+    
+    for v in graph['vertexes']:
+        graph['edges'][v] = set()
+    
+    groups = [range(g + 1, vertCount + 1, clusters)
+              for g in xrange(0, min(clusters, vertCount))]
+    
+    def addEdge(i, j):
+        graph['edges'][i].add(j)
+        graph['edges'][j].add(i)
+    
+    #Pairs within a cluster, numbered row by row of the lower
+    #triangle (a, b) with b < a
+    for group in groups:
+        a = 1
+        b = -1
+        for skip in pairSkips(p, rand):
+            b += skip + 1
+            while b >= a and a < len(group):
+                b -= a
+                a += 1
+            if a >= len(group):
+                break
+            addEdge(group[a], group[b])
+    
+    #Pairs between two clusters, numbered row by row
+    for g in xrange(0, len(groups)):
+        for h in xrange(g + 1, len(groups)):
+            width = len(groups[h])
+            pairs = len(groups[g]) * width
+            
+            position = -1
+            for skip in pairSkips(q, rand):
+                position += skip + 1
+                if position >= pairs:
+                    break
+                addEdge(groups[g][position // width], groups[h][position % width])
+    
+    return graph
+
+def pairSkips(p, rand):
+    '''Yields the number of pairs to skip before each edge, when
+    each pair has an edge with probability p. Each skip is
+    geometric, found from a single random number.
+
+    Uses: math
+    '''
+    if p <= 0:
+        return
+    
+    if p >= 1:
+        while True:
+            yield 0
+    
+    logq = math.log(1 - p)
+    while True:
+        yield int(math.log(1 - rand.random()) / logq)
     
 def plantedTrials(vertCount, clusters,
                   p=float(1), q=float(0),
                   maxTrials=100, subTrials=100, qstep=0):
-'''Automates the testing of multiple plantedL graphs
+    '''Automates the testing of multiple plantedL graphs
 
-Deprecated
-'''
+    Deprecated
+    '''
     data = [0] * maxTrials
     
     for i in xrange(0, maxTrials):
@@ -113,3 +190,152 @@ Deprecated
         
         q += qstep
     return data
+
+def parallelTrials(vertCount, clusters,
+                   p=float(1), q=float(0),
+                   maxTrials=100, subTrials=100, qstep=0,
+                   seed=0, workers=None):
+    '''Runs the trials of plantedTrials on a pool of worker
+    processes, building each graph with generatePlanted. Every
+    trial is given its own seed drawn from random.Random(seed), so
+    a sweep gives the same results for the same seed whatever the
+    number of workers. Returns the mean number of clusters found
+    for each value of q.
+
+    Uses: mathematics.parallel, random
+    '''
+    #Imported here so the other tests run without the package
+    from mathematics.parallel import pool_map
+    
+    rand = random.Random(seed)
+    
+    tasks = list()
+    for i in xrange(0, maxTrials):
+        for j in xrange(0, subTrials):
+            tasks.append((vertCount, clusters, p, q + i * qstep,
+                          rand.getrandbits(64)))
+    
+    counts = pool_map(plantedTrial, tasks, workers)
+    
+    data = [0] * maxTrials
+    for i in xrange(0, maxTrials):
+        data[i] = sum(counts[i * subTrials:(i + 1) * subTrials]) / float(subTrials)
+    
+    return data
+
+def plantedTrial(task):
+    '''Clusters one seeded planted graph and returns the number
+    of clusters found. Runs in a worker process.'''
+    vertCount, clusters, p, q, seed = task
+    grph = generatePlanted(vertCount, clusters, p, q, seed)
+    
+    return len(graphcluster.cluster(grph)[0])
+
+def compareLouvain(grph):
+    '''Clusters the graph with both graphcluster.cluster and
+    graphlouvain.cluster, so the multilevel method can be checked
+    against edge-betweenness clustering on graphs such as
+    create_test() and generatePlantedL(). Returns the number of
+    clusters and the modularity of the best clustering of each.
+    '''
+    result = list()
+    
+    for method in (graphcluster.cluster, graphlouvain.cluster):
+        clusters = method(grph)[0]
+        modularity = graphcluster.suggestedModularity(clusters, grph)
+        result.append([len(clusters), modularity])
+        
+    return result
+
+def referenceCluster(grph):
+    '''Clusters the graph as graphcluster.cluster did before the
+    components and the modularity were tracked: the components are
+    found again with graph.disconnectedComponents after every
+    removal, the clusters holding either end of the removed edge are
+    reevaluated, and the modularity is recomputed. Returns the
+    removed edges and the cut data rows.
+    '''
+    tmpgraph = copy.deepcopy(grph)
+    
+    edgeValues = graphcluster.EdgeValueHeap()
+    for vertex in grph['vertexes']:
+        for toVertex in grph['edges'][vertex]:
+            edgeValues[frozenset([vertex, toVertex])] = 0
+    
+    graphcluster.updateEdgeValues(grph['vertexes'], grph, edgeValues)
+    
+    clusters = graph.disconnectedComponents(grph)
+    removed = list()
+    cutData = [[len(clusters), graphcluster.suggestedModularity(clusters, grph)]]
+    
+    while edgeValues:
+        lostEdge = graphcluster.removeMostTraversedEdge(tmpgraph, edgeValues)
+        removed.append(tuple(lostEdge))
+        
+        clusters = graph.disconnectedComponents(tmpgraph)
+        
+        reevaluate = set()
+        for cluster in clusters:
+            if lostEdge[0] in cluster or lostEdge[1] in cluster:
+                reevaluate |= cluster
+        
+        graphcluster.updateEdgeValues(reevaluate, tmpgraph, edgeValues)
+        
+        cutData.append([len(clusters),
+                        graphcluster.suggestedModularity(clusters, grph)])
+    
+    return removed, cutData
+
+def checkComponentTracking(grph):
+    '''Checks that graphcluster.cluster removes the same edges and
+    gives the same cut data as referenceCluster. Returns the first
+    iteration that differs, or None.
+    '''
+    removed = list()
+    result = graphcluster.cluster(grph,
+                                  observers=[lambda event: removed.append(event.edge)])
+    
+    expectedRemoved, expectedCutData = referenceCluster(grph)
+    
+    for i, edge in enumerate(expectedRemoved):
+        if frozenset(removed[i]) != frozenset(edge):
+            return i
+        
+        count, modularity = result[1][i + 1]
+        if (count != expectedCutData[i + 1][0]
+                or abs(modularity - expectedCutData[i + 1][1]) > 1e-9):
+            return i
+    
+    return None
+
+def checkResume(grph, checkpoint, checkpointInterval=10, crashAt=37):
+    '''Checks that a graphcluster.cluster run that is stopped at
+    iteration crashAt and resumed from its checkpoint file gives
+    the same best clusters, cut data and hierarchy as a run that is
+    not stopped. The checkpoint file is removed afterwards.
+    '''
+    expected = graphcluster.cluster(grph)
+    
+    def crash(event):
+        if event.iteration == crashAt:
+            raise KeyboardInterrupt()
+    
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    
+    try:
+        graphcluster.cluster(grph, checkpoint=checkpoint,
+                             checkpointInterval=checkpointInterval,
+                             observers=[crash])
+    except KeyboardInterrupt:
+        pass
+    
+    try:
+        result = graphcluster.cluster(grph, checkpoint=checkpoint,
+                                      checkpointInterval=checkpointInterval)
+    finally:
+        os.remove(checkpoint)
+    
+    return (result[0] == expected[0]
+            and list(result[1]) == list(expected[1])
+            and result[2].toList() == expected[2].toList())
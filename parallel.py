@@ -0,0 +1,57 @@
+from multiprocessing import Pool, cpu_count
+from itertools import imap
+
+#The tasks are split into about this many chunks per worker, so
+#one slow chunk does not leave the other workers idle
+CHUNKS_PER_WORKER = 4
+
+def worker_count( workers = None ):
+	'''Returns the number of workers to use, by default one per CPU'''
+	if workers is None:
+		return cpu_count()
+	return workers
+
+def chunk_count( workers = None ):
+	'''Returns how many chunks to split the work into for the workers'''
+	return CHUNKS_PER_WORKER * worker_count( workers )
+
+def pool_map( function, tasks, workers = None ):
+	'''
+	Returns the results of the function for each task, in order,
+	computed by a pool of worker processes. With one worker the tasks
+	are run in this process. The function must be defined at the top
+	level of a module so the workers can find it.
+	'''
+	tasks = list( tasks )
+	workers = worker_count( workers )
+
+	if workers == 1:
+		return map( function, tasks )
+
+	pool = Pool( workers )
+	try:
+		return pool.map( function, tasks, max( 1, len( tasks ) // chunk_count( workers ) ) )
+	finally:
+		pool.close()
+		pool.join()
+
+def pool_imap( function, tasks, workers = None ):
+	'''
+	Yields the results of the function for each task, in order, as
+	the pool of worker processes finishes them. The workers are
+	stopped when the generator is closed, so the caller can stop early.
+	'''
+	workers = worker_count( workers )
+
+	if workers == 1:
+		for result in imap( function, tasks ):
+			yield result
+		return
+
+	pool = Pool( workers )
+	try:
+		for result in pool.imap( function, tasks ):
+			yield result
+	finally:
+		pool.terminate()
+		pool.join()